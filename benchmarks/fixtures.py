@@ -0,0 +1,118 @@
+"""Synthetic data for the benchmarks: system identification results, a run
+table and bicycle parameter sets that mimic the lab data, so the benchmarks
+run without the paths in bicycleid/config.py."""
+
+import os
+
+import numpy as np
+import pandas
+from scipy.io import savemat
+
+riders = ['Charlie', 'Jason', 'Luke']
+maneuvers = ['Balance', 'Balance With Disturbance', 'Track Straight Line',
+        'Track Straight Line With Disturbance']
+# labeled as in the database
+environments = ['Horse Treadmill', 'Pavillion Floor']
+speedBins = [1.4, 2.0, 3.0, 4.0, 4.92, 5.8, 7.0, 9.0]
+
+# the benchmark bicycle from Meijaard et al. 2007
+benchmarkParameters = {
+    'w': 1.02, 'c': 0.08, 'lam': np.pi / 10., 'g': 9.81,
+    'rR': 0.3, 'mR': 2.0, 'IRxx': 0.0603, 'IRyy': 0.12,
+    'xB': 0.3, 'zB': -0.9, 'mB': 85.0, 'IBxx': 9.2, 'IByy': 11.0,
+    'IBzz': 2.8, 'IBxz': 2.4,
+    'xH': 0.9, 'zH': -0.7, 'mH': 4.0, 'IHxx': 0.05892, 'IHyy': 0.06,
+    'IHzz': 0.00708, 'IHxz': -0.00756,
+    'rF': 0.35, 'mF': 3.0, 'IFxx': 0.1405, 'IFyy': 0.28,
+    }
+
+class SyntheticBicycle(object):
+    """Stands in for a bicycleparameters.Bicycle with a rider, computing the
+    Whipple model from a set of benchmark parameters."""
+
+    def __init__(self, parameters):
+        self.parameters = {'Benchmark': dict(parameters)}
+
+    def canonical(self, nominal=False):
+        from bicycleparameters.bicycle import benchmark_par_to_canonical
+        return benchmark_par_to_canonical(dict(self.parameters['Benchmark']))
+
+    def state_space(self, speed, nominal=False):
+        from bicycleparameters.bicycle import ab_matrix
+        M, C1, K0, K2 = self.canonical(nominal=nominal)
+        return ab_matrix(M, C1, K0, K2, speed,
+                self.parameters['Benchmark']['g'])
+
+def parameter_set(seed=0, spread=0.05):
+    """Returns the benchmark parameters with each value scaled by a random
+    factor, like a different rider and bicycle combination."""
+    random = np.random.RandomState(seed)
+    return {k: v * (1. + spread * random.randn()) if k != 'g' else v
+            for k, v in benchmarkParameters.items()}
+
+def system_id_results(numRuns, seed=0):
+    """Returns the contents of a system identification .mat file and the
+    matching run table for a number of runs.
+
+    Returns
+    -------
+    mat : dictionary
+        The variables of the .mat file.
+    runTable : pandas.DataFrame
+        The Rider, Maneuver, Environment and Speed of each run indexed by
+        run id.
+
+    """
+
+    random = np.random.RandomState(seed)
+
+    speeds = random.uniform(1., 9.5, numRuns)
+
+    # perturb the Whipple model at a few speeds to get plausible systems
+    bicycle = SyntheticBicycle(benchmarkParameters)
+    grid = np.linspace(1., 9.5, 18)
+    gridA, gridB = zip(*[bicycle.state_space(v) for v in grid])
+    nearest = np.abs(speeds[:, np.newaxis] - grid).argmin(axis=1)
+
+    stateMatrices = np.array(gridA)[nearest]
+    stateMatrices[:, 2:, :] *= 1. + 0.1 * random.randn(numRuns, 2, 4)
+    inputMatrices = np.zeros((numRuns, 4, 2))
+    inputMatrices[:, :, 0] = np.array(gridB)[nearest][:, :, 1]
+    inputMatrices[:, 2:, :] *= 1. + 0.1 * random.randn(numRuns, 2, 2)
+    inputMatrices[:, 2:, 1] = 0.01 * random.randn(numRuns, 2)
+
+    runIDs = np.arange(numRuns)
+
+    # the result files are named by the zero padded run id
+    mat = {'matFiles': np.array(['{:0>5}.mat'.format(r) for r in runIDs],
+               dtype=object),
+           'speeds': speeds,
+           'durations': random.uniform(10., 60., numRuns),
+           'fits': random.uniform(0., 100., (numRuns, 4)),
+           'stateMatrices': stateMatrices,
+           'inputMatrices': inputMatrices}
+
+    bins = np.array(speedBins)
+    runTable = pandas.DataFrame({
+        'Rider': np.array(riders)[random.randint(0, 3, numRuns)],
+        'Maneuver': np.array(maneuvers)[random.randint(0, 4, numRuns)],
+        'Environment': np.array(environments)[random.randint(0, 2, numRuns)],
+        'Speed': bins[np.abs(speeds[:, np.newaxis] - bins).argmin(axis=1)]},
+        index=runIDs)
+
+    return mat, runTable
+
+def write_system_id_results(directory, numRuns, seed=0):
+    """Writes a synthetic system identification .mat file and returns its
+    path and the matching run table."""
+
+    mat, runTable = system_id_results(numRuns, seed=seed)
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fileName = os.path.join(directory,
+            'synthetic-results-{}.mat'.format(numRuns))
+    savemat(fileName, mat)
+
+    return fileName, runTable
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""Times the main stages of BicycleID on synthetic data and stores the results
+for comparison across versions.
+
+Run all stages at the default scales and save the results with::
+
+    $ python benchmarks/run.py
+
+and compare against an earlier run with::
+
+    $ python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+
+try:
+    import tracemalloc
+except ImportError:
+    # peak memory isn't measured on Python 2
+    tracemalloc = None
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+# the package modules use implicit relative imports
+sys.path.insert(0, os.path.join(here, '..', 'bicycleid'))
+sys.path.insert(0, here)
+
+import fixtures
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+class Skip(Exception):
+    """Raised by a stage that can't run in this environment."""
+    pass
+
+def measure(func, repeat=1):
+    """Returns the minimum time in seconds of repeated calls to func, the
+    peak memory in bytes allocated during the first call and the result of
+    the first call. The first call is traced, so it is only timed if there
+    are no repeats."""
+
+    times = []
+    peak = None
+    result = None
+
+    for i in range(repeat):
+        if tracemalloc is not None and i == 0:
+            tracemalloc.start()
+        start = timer()
+        value = func()
+        times.append(timer() - start)
+        if i == 0:
+            result = value
+            if tracemalloc is not None:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    if len(times) > 1:
+        times = times[1:]
+
+    return min(times), peak, result
+
+def benchmark(numRuns, directory, repeat):
+    """Runs every stage for a number of runs and returns a list of
+    results."""
+
+    import data
+    import sources
+
+    fileName, runTable = fixtures.write_system_id_results(directory, numRuns)
+    source = sources.DataSource(systemID=fileName, runTable=runTable,
+            parameters={rider: fixtures.SyntheticBicycle(
+                fixtures.parameter_set(seed=i)) for i, rider in
+                enumerate(fixtures.riders)})
+    w = np.logspace(-1, 2., num=200)
+
+    results = []
+
+    def stage(name, func, repeat=repeat):
+        try:
+            seconds, peak, result = measure(func, repeat=repeat)
+        except Skip as e:
+            print('{:>8} {:<24} skipped: {}'.format(numRuns, name, e))
+            results.append({'runs': numRuns, 'stage': name, 'skipped': str(e)})
+            return None
+        print('{:>8} {:<24} {:10.4f} s {:>10}'.format(numRuns, name, seconds,
+            '' if peak is None else '{:.1f} MB'.format(peak / 1e6)))
+        results.append({'runs': numRuns, 'stage': name, 'seconds': seconds,
+            'peakBytes': peak})
+        return result
+
+    exp = stage('ExperimentalData', lambda: data.ExperimentalData(w=w,
+        source=source), repeat=1)
+
+    subsetArgs = {'Rider': ['Jason', 'Luke'], 'Environment': ['Treadmill'],
+            'Maneuver': ['Balance', 'Track Straight Line'],
+            'Speed': ['2.0', '4.0', '5.8'], 'MeanFit': 20.}
+
+    stage('subset', lambda: exp.subset(**subsetArgs))
+    stage('subset_bode', lambda: exp.subset_bode(**subsetArgs))
+    stage('subset_eig', lambda: exp.subset_eig(**subsetArgs))
+
+    import aggregate
+
+    summary = stage('CoefficientSummary', lambda:
+            aggregate.CoefficientSummary(exp.dataFrame), repeat=1)
+    stage('summarize', lambda:
+            summary.summarize(groupBy='Speed', **subsetArgs))
+
+    try:
+        import model
+    except ImportError as e:
+        model = None
+        modelError = str(e)
+
+    def construct():
+        if model is None:
+            raise Skip(modelError)
+        return [model.Whipple(rider, source=source) for rider in
+                fixtures.riders]
+
+    models = stage('Whipple', construct, repeat=1)
+
+    def construct_concurrently():
+        if model is None:
+            raise Skip(modelError)
+        import registry
+        models = registry.ModelRegistry(source)
+        models.submit_all(fixtures.riders)
+        try:
+            return models.models()
+        finally:
+            models.shutdown()
+
+    stage('ModelRegistry', construct_concurrently, repeat=1)
+
+    speeds = np.linspace(0., 10., num=100)
+
+    def matrices():
+        if models is None:
+            raise Skip(modelError)
+        return [mod.matrices(speeds) for mod in models]
+
+    def magnitude_phase():
+        if models is None:
+            raise Skip(modelError)
+        return [mod.magnitude_phase(v, w) for mod in models for v in
+                speeds[1::10]]
+
+    stage('Whipple.matrices', matrices)
+    stage('Whipple.magnitude_phase', magnitude_phase)
+
+    def compare():
+        if models is None:
+            raise Skip(modelError)
+        import metrics
+        return metrics.compare(exp, dict(zip(fixtures.riders, models)))
+
+    stage('metrics.compare', compare)
+
+    def coefficient_plot():
+        import plot
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        # draw offscreen instead of in a GTK window
+        plot.canvasFactory = FigureCanvasAgg
+        coefPlot = plot.CoefficientPlot()
+        mod = {rider: m.matrices(np.linspace(0., 10., num=8)) for rider, m in
+                zip(fixtures.riders, models or [])}
+        coefPlot.update_graph(exp.subset(**subsetArgs), mod)
+        coefPlot.canvas.draw()
+
+    stage('CoefficientPlot', coefficient_plot)
+
+    return results
+
+def version():
+    """Returns the git revision of the working tree, or unknown."""
+    try:
+        return subprocess.check_output(['git', 'describe', '--always',
+            '--dirty'], cwd=here).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results, previous):
+    """Prints the ratio of each stage's time to a previous run."""
+
+    old = {(r['runs'], r['stage']): r for r in previous['results']}
+
+    print('\nCompared to {} ({})'.format(previous['version'],
+        previous['date']))
+    for r in results['results']:
+        o = old.get((r['runs'], r['stage']))
+        if o is None or 'seconds' not in r or 'seconds' not in o:
+            continue
+        print('{:>8} {:<24} {:10.4f} s {:10.4f} s {:6.2f}x'.format(r['runs'],
+            r['stage'], o['seconds'], r['seconds'],
+            r['seconds'] / o['seconds']))
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+',
+            default=[100, 10000, 100000],
+            help='The numbers of runs to benchmark.')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='The number of times the fast stages are repeated.')
+    parser.add_argument('--output', default=os.path.join(here, 'results'),
+            help='The directory to save the results in.')
+    parser.add_argument('--compare', help='A previous results file.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bicycleid-benchmark-')
+
+    results = {'version': version(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'host': socket.gethostname(),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'results': []}
+
+    try:
+        for numRuns in args.scales:
+            results['results'] += benchmark(numRuns, directory, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    path = os.path.join(args.output, '{}-{}.json'.format(
+        results['date'].replace(':', ''), results['version']))
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nSaved the results to {}'.format(path))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+import numpy as np
+import pandas
+
+import data
+import instrument
+
+class CoefficientSummary(object):
+    """Precomputed statistics of the coefficients and fits for every
+    combination of rider, maneuver, environment, speed bin and mean fit bin,
+    so that the summary of any subset selected with the GUI toggles is found
+    by merging a few cells instead of scanning every run.
+
+    Each cell holds the count, sum and sum of squares of each column, which
+    give the mean and standard deviation, and a histogram over bins that are
+    shared by all cells, which gives approximate quantiles.
+
+    """
+
+    keys = ['Rider', 'Maneuver', 'Environment', 'Speed']
+
+    def __init__(self, dataFrame, columns=None, fitStep=5.0, numBins=100):
+        """
+        Parameters
+        ----------
+        dataFrame : pandas.DataFrame
+            The ExperimentalData data frame.
+        columns : list, optional
+            The columns to summarize, defaults to the a and b coefficients,
+            the fits, the speed and the duration.
+        fitStep : float, optional
+            The width of the MeanFit bins, only the runs in the bin that
+            holds a MeanFit threshold are checked individually.
+        numBins : integer, optional
+            The number of histogram bins for the quantiles.
+
+        """
+
+        if columns is None:
+            columns = ([c for c in dataFrame.columns if c[0] in 'ab' and
+                c[1:].isdigit()] + [c for c in dataFrame.columns if
+                    c.endswith('Fit')] + ['ActualSpeed', 'Duration'])
+
+        self.columns = columns
+        self.fitStep = fitStep
+
+        # the histogram edges, the outer bins collect values outside of them
+        values = dataFrame[columns].values.astype(float)
+        with np.errstate(invalid='ignore'):
+            lower = np.nanmin(values, axis=0)
+            upper = np.nanmax(values, axis=0)
+        self.edges = np.array([np.linspace(l, u, numBins + 1) for l, u in
+            zip(lower, upper)])
+
+        self.cells = None
+        self.update(dataFrame)
+
+    def _group(self, keys):
+        """Returns the unique rows of keys and the group number of each
+        row, missing keys form groups of their own."""
+        keys = keys.reset_index(drop=True)
+        groups = keys.groupby(list(keys.columns), sort=False, observed=True,
+                dropna=False).ngroup().values
+        first = np.unique(groups, return_index=True)[1]
+        return keys.iloc[first].reset_index(drop=True), groups
+
+    def _total(self, a, groups, numGroups):
+        """Returns the sum of the rows of a in each group."""
+        out = np.zeros((numGroups,) + a.shape[1:], dtype=a.dtype)
+        np.add.at(out, groups, a)
+        return out
+
+    def _statistics(self, values, groups, numGroups):
+        """Returns the counts, sums, sums of squares and histograms of the
+        rows of values in each group."""
+
+        finite = np.isfinite(values)
+        filled = np.where(finite, values, 0.)
+
+        counts = self._total(finite.astype(int), groups, numGroups)
+        sums = self._total(filled, groups, numGroups)
+        squares = self._total(filled**2, groups, numGroups)
+
+        # count the values in each group, column and histogram bin at once
+        numCols = len(self.columns)
+        numBins = self.edges.shape[1] + 1
+        bins = np.column_stack([np.searchsorted(self.edges[j], values[:, j],
+            side='right') for j in range(numCols)])
+        flat = ((groups[:, np.newaxis] * numCols + np.arange(numCols)) *
+                numBins + bins)
+        hist = np.bincount(flat[finite], minlength=numGroups * numCols *
+                numBins).reshape((numGroups, numCols, numBins))
+
+        return counts, sums, squares, hist
+
+    @instrument.timed('aggregate.update')
+    def update(self, dataFrame):
+        """Adds the statistics of new runs, e.g. from ingested results.
+
+        Parameters
+        ----------
+        dataFrame : pandas.DataFrame
+            The rows of the new runs.
+
+        """
+
+        keys = dataFrame[self.keys].copy()
+        fits = dataFrame['MeanFit'].values.astype(float)
+        # a missing MeanFit gives a missing bin, which no threshold selects
+        keys['FitBin'] = np.floor(fits / self.fitStep)
+        cells, groups = self._group(keys)
+
+        values = dataFrame[self.columns].values.astype(float)
+        statistics = self._statistics(values, groups, len(cells))
+
+        if self.cells is not None:
+            merged, cellGroups = self._group(pandas.concat([self.cells,
+                cells]))
+            numOld = len(self.cells)
+            old = (self.counts, self.sums, self.squares, self.hist)
+            statistics = tuple(self._total(np.concatenate((o, n)),
+                cellGroups, len(merged)) for o, n in zip(old, statistics))
+            cells = merged
+            groups = np.concatenate((cellGroups[:numOld][self.rowCells],
+                cellGroups[numOld:][groups]))
+            values = np.concatenate((self.rowValues, values))
+            fits = np.concatenate((self.rowFits, fits))
+
+        self.cells = cells
+        self.counts, self.sums, self.squares, self.hist = statistics
+        # the rows are kept to apply MeanFit thresholds exactly in the cells
+        # of the bin the threshold falls in
+        self.rowCells = groups
+        self.rowValues = values
+        self.rowFits = fits
+
+    def select(self, **kwargs):
+        """Returns the cells in the subset.
+
+        Parameters
+        ----------
+        same as ExperimentalData.subset() except that Duration isn't
+        supported.
+
+        Returns
+        -------
+        selected : ndarray, shape(n,)
+            True for the cells whose runs are all in the subset.
+        boundary : ndarray, shape(n,)
+            True for the cells in the MeanFit bin that holds the threshold,
+            only some of their runs are in the subset.
+
+        """
+
+        if 'Duration' in kwargs:
+            raise ValueError('Duration is not summarized, use '
+                    'ExperimentalData.subset.')
+
+        cells = self.cells
+        # the MeanFit threshold is applied to the fit bins below
+        selected = data.ExperimentalData.select_rows(cells, **{k: v for k, v
+            in kwargs.items() if k != 'MeanFit'})
+
+        boundary = np.zeros(len(cells), dtype=bool)
+
+        if 'MeanFit' in kwargs:
+            fitBins = cells['FitBin'].values
+            threshold = np.floor(kwargs['MeanFit'] / self.fitStep)
+            with np.errstate(invalid='ignore'):
+                boundary = selected & (fitBins == threshold)
+                selected &= fitBins > threshold
+
+        return selected, boundary
+
+    @instrument.timed('aggregate.summarize')
+    def summarize(self, groupBy=None, quantiles=(0.25, 0.5, 0.75), **kwargs):
+        """Returns the statistics of each column for a subset of the runs.
+
+        Parameters
+        ----------
+        groupBy : string or list, optional
+            Key columns to summarize separately, e.g. 'Speed'.
+        quantiles : tuple, optional
+            The approximate quantiles to compute.
+        kwargs
+            The subset, see select.
+
+        Returns
+        -------
+        summary : pandas.DataFrame
+            The columns are a MultiIndex of the summarized column and the
+            statistic: count, mean, std (with ddof=1, like pandas) and the
+            quantiles, e.g. (a31, 0.5).
+            There is a row for each group, or a single row if groupBy is
+            None.
+
+        """
+
+        selected, boundary = self.select(**kwargs)
+        candidates = selected | boundary
+
+        # the output group of each cell
+        cellGroups = np.zeros(len(self.cells), dtype=int)
+        if groupBy is None:
+            index = pandas.Index(['All'])
+        else:
+            keys = self.cells[candidates].groupby(groupBy, observed=True,
+                    dropna=False)
+            cellGroups[candidates] = keys.ngroup().values
+            index = keys.size().index
+
+        counts, sums, squares, hist = [self._total(a[selected],
+            cellGroups[selected], len(index)) for a in [self.counts,
+                self.sums, self.squares, self.hist]]
+
+        # add the runs of the boundary cells that pass the threshold
+        if boundary.any():
+            rows = np.nonzero(boundary[self.rowCells])[0]
+            with np.errstate(invalid='ignore'):
+                rows = rows[self.rowFits[rows] > kwargs['MeanFit']]
+            for total, a in zip([counts, sums, squares, hist],
+                    self._statistics(self.rowValues[rows],
+                        cellGroups[self.rowCells[rows]], len(index))):
+                total += a
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = sums / counts
+            # the sample standard deviation, like pandas, so a single run
+            # has none
+            std = np.where(counts > 1, np.sqrt(np.maximum(squares - counts *
+                mean**2, 0.) / (counts - 1)), np.nan)
+
+        stats = {}
+        for j, col in enumerate(self.columns):
+            stats[(col, 'count')] = counts[:, j]
+            stats[(col, 'mean')] = mean[:, j]
+            stats[(col, 'std')] = std[:, j]
+            for q in quantiles:
+                stats[(col, q)] = [self._quantile(h, self.edges[j], q) for h
+                        in hist[:, j]]
+
+        columns = pandas.MultiIndex.from_tuples([(col, s) for col in
+            self.columns for s in ['count', 'mean', 'std'] + list(quantiles)])
+
+        return pandas.DataFrame(stats, index=index, columns=columns)
+
+    def _quantile(self, hist, edges, q):
+        """Returns a quantile interpolated from a histogram, the values
+        outside of the edges are counted at the nearest edge."""
+
+        total = hist.sum()
+        if total == 0:
+            return np.nan
+
+        cumulative = np.cumsum(hist)
+        target = q * total
+        i = np.searchsorted(cumulative, target)
+
+        if i == 0:
+            return edges[0]
+        elif i == len(hist) - 1:
+            return edges[-1]
+
+        # linear interpolation within bin i, which spans edges[i - 1:i + 1]
+        before = cumulative[i - 1]
+        fraction = (target - before) / hist[i]
+        return edges[i - 1] + fraction * (edges[i] - edges[i - 1])
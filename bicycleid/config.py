@@ -9,6 +9,12 @@ PATH_TO_BD = "/media/Data/Documents/School/UC Davis/Bicycle Mechanics/BicycleDAQ
 PATH_TO_H5 = os.path.join(PATH_TO_BD, 'data/h5/')
 PATH_TO_BS = "/media/Data/Documents/School/UC Davis/Bicycle Mechanics/BicycleSystemID/"
 PATH_TO_SYSTEM_ID_DATA = os.path.join(PATH_TO_BS, 'scripts', 'statespaceid', 'whipple-structured-results.mat')
+# directory of per run or per batch result files that are added as they appear
+PATH_TO_SYSTEM_ID_RESULTS = os.path.join(PATH_TO_BS, 'scripts', 'statespaceid', 'results')
+# memory mapped Bode magnitude and phase arrays
+PATH_TO_BODE_STORE = os.path.join(os.path.expanduser('~'), '.bicycleid', 'bode')
+# unix socket of the shared data server, see server.py
+PATH_TO_DATA_SERVER = os.path.join(os.path.expanduser('~'), '.bicycleid', 'server.sock')
 #PATH_TO_SYSTEM_ID_DATA = os.path.join(PATH_TO_BS, 'scripts',
         #'whipple-structured-results-x0-K-freeones-phi.mat')
 #PATH_TO_SYSTEM_ID_DATA = os.path.join(PATH_TO_BS, 'scripts',
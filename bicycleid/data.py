@@ -1,10 +1,6 @@
 import os
 import pandas
 import numpy as np
-from scipy.io import loadmat
-import bicycledataprocessor as bdp
-from bicycledataprocessor.database import get_row_num
-from dtk import control
 
 # debugging
 try:
@@ -14,117 +10,365 @@ except ImportError:
 else:
     set_trace = Tracer()
 
-from config import (PATH_TO_SYSTEM_ID_DATA, PATH_TO_DATABASE, PATH_TO_H5,
-        PATH_TO_CORRUPT)
+import frequency
+import instrument
+import sources
+
+def stack_matrices(matrices):
+    """Returns the matrices loaded from a .mat file as a float array of shape
+    (n, rows, columns), whether they were stored as a cell array, a three
+    dimensional array or squeezed to a single matrix."""
+    matrices = np.asarray(matrices)
+    if matrices.dtype == object:
+        matrices = np.array([np.asarray(m, dtype=float) for m in matrices])
+    else:
+        matrices = matrices.astype(float)
+    return matrices.reshape((-1,) + matrices.shape[-2:])
 
 class ExperimentalData(object):
 
     states = ['Phi', 'Delta', 'PhiDot', 'DeltaDot']
     inputs = ['TDelta']
+    tableCols = ['Rider', 'Maneuver', 'Environment', 'Speed']
+    # the columns stored as pandas categoricals
+    categoricalCols = ['Rider', 'Maneuver', 'Environment']
+    # the database environment labels and the names used everywhere else,
+    # the first is misspelled in the database
+    environments = {'Pavillion Floor': 'Pavilion',
+                    'Horse Treadmill': 'Treadmill'}
+    speedBins = ['1.4', '2.0', '3.0', '4.0', '4.92', '5.8', '7.0', '9.0']
+    # the largest difference between a run's speed and its bin
+    speedTolerance = 1e-5
+    # set to np.float32 to halve the memory used by the coefficient columns
+    coefficientDtype = np.float64
+    # the output matrix for the roll and steer angle transfer functions
+    outputMatrix = np.array([[1., 0., 0., 0.],
+                             [0., 1., 0., 0.]])
+    # the number of runs evaluated at once when computing the Bode data
+    bodeChunkSize = 1000
+
+    @instrument.timed('data.ExperimentalData')
+    def __init__(self, fileName=None, w=None, bodeStore=None, source=None):
+        """Loads the system identification results and the run table to
+        construct a data frame.
 
-    def __init__(self, fileName=None, w=None):
-        """Loads a .mat file and data from the database to construct a
-        data frame."""
+        Parameters
+        ----------
+        fileName : string, optional
+            The path to the system identification results, defaults to the
+            source's.
+        w : ndarray, shape(n,), optional
+            The frequencies in radians/second for the Bode data.
+        bodeStore : storage.BodeStore, optional
+            If supplied the magnitudes and phases are kept in this memory
+            mapped store, only the runs missing from it are computed.
+        source : sources.DataSource, optional
+            Where the data is loaded from, defaults to
+            sources.default_source().
+
+        """
+
+        if source is None:
+            source = sources.default_source()
+        if fileName is not None:
+            source = source.copy(systemID=fileName)
+        self.source = source
 
-        if fileName is None:
-            self.fileName = PATH_TO_SYSTEM_ID_DATA
+        # None if the results were supplied in memory
+        if isinstance(source.systemID, dict):
+            self.fileName = None
         else:
-            self.fileName = fileName
+            self.fileName = source.systemID
 
         if w is None:
             w = np.logspace(-1.0, 1.0, num=100)
 
-        mat = loadmat(self.fileName, squeeze_me=True)
+        self.w = w
+        self.bodeStore = bodeStore
+
+        # run id -> result file of the runs that aren't in the run table yet
+        self.heldBack = {}
+
+        d, self.stateMatrices, self.inputMatrices = self._hold_back(
+                self.fileName, *self._parse_mat(source.systemID))
+
+        self.dataFrame = self._frame(d)
+
+        self.poles, self.residues = self.modal_form(self.stateMatrices,
+                self.inputMatrices)
+
+        self.load_bode_data()
+        self.load_eig_data()
+
+    @instrument.timed('data.parse_mat')
+    def _parse_mat(self, systemID):
+        """Returns the data frame columns, state matrices and input matrices
+        for the runs in a system identification result file.
+
+        Parameters
+        ----------
+        systemID : string or dictionary
+            The path to a .mat file with the results for one or more runs or
+            its contents.
+
+        Returns
+        -------
+        d : dictionary
+            The data frame column arrays, including the columns from the
+            database run table with the environments normalized.
+        stateMatrices : ndarray, shape(n, 4, 4)
+            The identified state matrix for each run.
+        inputMatrices : ndarray, shape(n, 4, m)
+            The identified input matrix for each run.
+
+        """
+
+        with instrument.timer('data.loadmat'):
+            mat = self.source.load_mat(systemID)
+
+        # squeeze_me collapses the arrays of files with a single run
+        fits = np.atleast_2d(mat['fits'])
+        stateMatrices = stack_matrices(mat['stateMatrices'])
+        inputMatrices = stack_matrices(mat['inputMatrices'])
 
         d = {}
 
-        d['RunID'] = [os.path.splitext(str(r))[0] for r in mat['matFiles']]
-        d['ActualSpeed'] = mat['speeds']
-        d['Duration'] = mat['durations']
+        d['RunID'] = np.array([int(os.path.splitext(str(r))[0]) for r in
+                np.atleast_1d(mat['matFiles'])], dtype=int)
+        d['ActualSpeed'] = np.atleast_1d(mat['speeds']).astype(float)
+        d['Duration'] = np.atleast_1d(mat['durations']).astype(float)
 
-        for fit in mat['fits']:
-            for i, state in enumerate(self.states):
-                try:
-                    d[state + 'Fit'].append(fit[i])
-                except KeyError:
-                    d[state + 'Fit'] = [fit[i]]
+        for i, state in enumerate(self.states):
+            d[state + 'Fit'] = fits[:, i].astype(float)
 
-        d['MeanFit'] = np.mean(mat['fits'], 1)
+        d['MeanFit'] = np.mean(fits, 1)
 
-        self.stateMatrices = mat['stateMatrices']
+        for i in range(2, 4):
+            for j in range(len(self.states)):
+                col = 'a' + str(i + 1) + str(j + 1)
+                d[col] = stateMatrices[:, i, j].astype(self.coefficientDtype)
 
-        for A in mat['stateMatrices']:
-            for i in range(2, 4):
-                for j in range(len(self.states)):
-                    col = 'a' + str(i + 1) + str(j + 1)
-                    try:
-                        d[col].append(A[i, j])
-                    except KeyError:
-                        d[col] = [A[i, j]]
+        for i in range(2, 4):
+            for j in range(0, 2):
+                col = 'b' + str(i + 1) + str(j + 1)
+                d[col] = inputMatrices[:, i, j].astype(self.coefficientDtype)
 
-        self.inputMatrices = mat['inputMatrices']
+        with instrument.timer('data.run_table'):
+            table = self.source.run_table(d['RunID'])
 
-        for B in mat['inputMatrices']:
-            for i in range(2, 4):
-                for j in range(0, 2):
-                    col = 'b' + str(i + 1) + str(j + 1)
-                    try:
-                        d[col].append(B[i, j])
-                    except KeyError:
-                        d[col] = [B[i, j]]
+        for col in self.tableCols:
+            d[col] = np.asarray(table[col])
 
-        dataset = bdp.DataSet(fileName=PATH_TO_DATABASE, pathToH5=PATH_TO_H5,
-                pathToCorruption=PATH_TO_CORRUPT)
-        dataset.open()
+        d['Environment'] = pandas.Series(d['Environment'],
+                dtype=object).replace(self.environments).values
+        d['Speed'] = d['Speed'].astype(float)
 
-        table = dataset.database.root.runTable
+        return d, stateMatrices, inputMatrices
 
-        tableCols = ['Rider', 'Maneuver', 'Environment', 'Speed']
+    def _hold_back(self, fileName, d, stateMatrices, inputMatrices):
+        """Removes the runs that aren't in the run table yet from the parsed
+        results and records them in self.heldBack, so they can be added once
+        the run table has them."""
 
-        for col in tableCols:
-            d[col] = []
+        known = pandas.notnull(d['Rider'])
 
-        for r in d['RunID']:
-            i = get_row_num(r, table)
-            for col in tableCols:
-                d[col].append(table[i][col])
+        for runID in d['RunID'][~known]:
+            self.heldBack[int(runID)] = fileName
+        for runID in d['RunID'][known]:
+            self.heldBack.pop(int(runID), None)
 
-        dataset.close()
+        if known.all():
+            return d, stateMatrices, inputMatrices
+        else:
+            return ({k: v[known] for k, v in d.items()}, stateMatrices[known],
+                    inputMatrices[known])
+
+    def _frame(self, d):
+        """Returns a data frame of the parsed columns with the rider,
+        maneuver and environment as categoricals."""
+        frame = pandas.DataFrame(d)
+        for col in self.categoricalCols:
+            frame[col] = frame[col].astype('category')
+        return frame
+
+    @instrument.timed('data.append')
+    def append(self, fileName):
+        """Adds the runs in a system identification result file to the data
+        frame and computes their Bode and eigenvalue data. Runs that are
+        already loaded are skipped and runs that aren't in the run table yet
+        are held back, see self.heldBack.
 
-        self.dataFrame = pandas.DataFrame(d)
+        Parameters
+        ----------
+        fileName : string
+            The path to a .mat file with the results for one or more runs.
 
-        self.w = w
+        Returns
+        -------
+        new : pandas.DataFrame
+            The rows that were added to the data frame.
 
-        self.load_bode_data()
-        self.load_eig_data()
+        """
+
+        d, stateMatrices, inputMatrices = self._hold_back(fileName,
+                *self._parse_mat(fileName))
+
+        new = self._frame(d)
+
+        isNew = np.logical_and(~new['RunID'].isin(self.dataFrame['RunID']),
+                ~new['RunID'].duplicated()).values
+
+        new = new[isNew]
+        stateMatrices = stateMatrices[isNew]
+        inputMatrices = inputMatrices[isNew]
+
+        if len(new) > 0:
+            # concatenating categoricals only keeps the dtype if they have the
+            # same categories
+            for col in self.categoricalCols:
+                categories = self.dataFrame[col].cat.categories.union(
+                        new[col].cat.categories)
+                self.dataFrame[col] = \
+                        self.dataFrame[col].cat.set_categories(categories)
+                new[col] = new[col].cat.set_categories(categories)
+            self.dataFrame = pandas.concat([self.dataFrame, new],
+                    ignore_index=True)
+            self.stateMatrices = np.concatenate((self.stateMatrices,
+                stateMatrices))
+            self.inputMatrices = np.concatenate((self.inputMatrices,
+                inputMatrices))
+            poles, residues = self.modal_form(stateMatrices, inputMatrices)
+            self.poles = np.concatenate((self.poles, poles))
+            self.residues = np.concatenate((self.residues, residues))
+            self.add_bode_data(new['RunID'].tolist(), poles, residues)
+            self.eig = np.concatenate((self.eig, poles.astype(np.complex64)))
+
+        return new
 
     def load_bode_data(self):
         """Computes the magnitude and phase information for the steer torque to
         roll angle and steer angle transfer functions for each of the
-        identified runs.
+        identified runs at the frequencies in self.w."""
+
+        if self.bodeStore is None:
+            self.magnitudes, self.phases = self.bode(self.poles,
+                    self.residues)
+        else:
+            self.numBodeRows = 0
+            self.add_bode_data(self.dataFrame['RunID'].tolist(), self.poles,
+                    self.residues)
+
+    def add_bode_data(self, runIDs, poles, residues):
+        """Computes and appends the magnitudes and phases for the supplied
+        runs.
+
+        With a store, the rows already stored for the runs are reused if
+        they follow the rows in use, e.g. the runs ingested before a restart,
+        and the data exposes only the leading rows of the store that belong
+        to its runs.
+
+        """
+
+        if self.bodeStore is None:
+            if len(runIDs) > 0:
+                magnitudes, phases = self.bode(poles, residues)
+                self.magnitudes = np.concatenate((self.magnitudes,
+                    magnitudes))
+                self.phases = np.concatenate((self.phases, phases))
+            return
+
+        store = self.bodeStore
+        start = self.numBodeRows
+
+        # the number of leading runs that are already stored in order
+        stored = np.array(store.runIDs[start:start + len(runIDs)])
+        different = np.nonzero(stored != np.array(runIDs[:len(stored)]))[0]
+        if len(different) > 0:
+            numReused = int(different[0])
+        else:
+            numReused = len(stored)
+
+        instrument.count('data.bodeStore.hit', numReused)
+        instrument.count('data.bodeStore.miss', len(runIDs) - numReused)
+
+        if numReused < len(runIDs):
+            # drop the stored rows of other runs before appending
+            if len(store) > start + numReused:
+                store.truncate(start + numReused)
+            magnitudes, phases = self.bode(poles[numReused:],
+                    residues[numReused:])
+            store.append(runIDs[numReused:], magnitudes, phases)
+
+        self.numBodeRows = start + len(runIDs)
+        self.magnitudes = store.magnitudes[:self.numBodeRows]
+        self.phases = store.phases[:self.numBodeRows]
+
+    @instrument.timed('data.modal_form')
+    def modal_form(self, stateMatrices, inputMatrices):
+        """Returns the pole-residue form of the steer torque to roll angle and
+        steer angle transfer functions for a set of identified systems.
 
         Parameters
         ----------
-        w : ndarray, shape(n,)
-            The frequencies in radians/second.
+        stateMatrices : ndarray, shape(n, 4, 4)
+            The state matrices.
+        inputMatrices : ndarray, shape(n, 4, m)
+            The input matrices, the first column being steer torque.
+
+        Returns
+        -------
+        poles : ndarray, shape(n, 4)
+            The eigenvalues of the state matrices.
+        residues : ndarray, shape(n, 4, 2)
+            The residue of each pole for the two transfer functions.
 
         """
 
-        numRuns = self.stateMatrices.shape[0]
+        poles, residues = frequency.modal_form(stateMatrices,
+                inputMatrices[:, :, :1], self.outputMatrix)
 
-        C = np.array([[1., 0., 0., 0.],
-                      [0., 1., 0., 0.]])
-        D = np.zeros((2, 1))
+        return poles, residues[:, :, :, 0]
 
-        self.magnitudes = np.zeros((numRuns, len(self.w), 2, 1))
-        self.phases = np.zeros((numRuns, len(self.w), 2, 1))
+    @instrument.timed('data.bode')
+    def bode(self, poles, residues, w=None):
+        """Returns the magnitude and phase of the steer torque to roll angle
+        and steer angle transfer functions for a set of identified systems.
 
-        for i, A in enumerate(self.stateMatrices):
-            B = self.inputMatrices[i][:, 0].reshape((4, 1))
-            sys = control.StateSpace(A, B, C, D)
-            bode = control.Bode(self.w)
-            self.magnitudes[i], self.phases[i] = bode.mag_phase_system(sys)
+        Parameters
+        ----------
+        poles : ndarray, shape(n, 4)
+            The poles of each system.
+        residues : ndarray, shape(n, 4, 2)
+            The residues of each system.
+        w : ndarray, shape(f,), optional
+            The frequencies in radians/second, defaults to self.w.
+
+        Returns
+        -------
+        magnitudes : ndarray, shape(n, f, 2)
+        phases : ndarray, shape(n, f, 2)
 
+        """
+
+        if w is None:
+            w = self.w
+
+        numRuns = poles.shape[0]
+
+        magnitudes = np.zeros((numRuns, len(w), 2))
+        phases = np.zeros((numRuns, len(w), 2))
+
+        # evaluate in chunks to bound the size of the complex intermediates
+        for start in range(0, numRuns, self.bodeChunkSize):
+            chunk = slice(start, start + self.bodeChunkSize)
+            H = frequency.modal_response(poles[chunk],
+                    residues[chunk][..., np.newaxis], w)[..., 0]
+            magnitudes[chunk], phases[chunk] = \
+                    frequency.magnitude_phase(H, axis=1)
+
+        return magnitudes, phases
+
+    @instrument.timed('data.subset_bode')
     def subset_bode(self, **kwargs):
         """Returns the mean and standard deviation of the magnitude and phase
         curves for the subset of data.
@@ -132,33 +376,42 @@ class ExperimentalData(object):
         Parameters
         ----------
         same as ExperimentalData.subset()
+        w : ndarray, shape(n,), optional
+            If supplied the curves are evaluated at these frequencies in
+            radians/second instead of self.w.
 
 
         Returns
         -------
-        meanMag : ndarray, shape(n, 2, 1)
+        meanMag : ndarray, shape(n, 2)
             The average of the magnitudes of the two transfer functions for n
             frequencies.
-        stdMag : ndarray, shape(n, 2, 1)
+        stdMag : ndarray, shape(n, 2)
             The standard deviation of the magnitudes of the two transfer
             functions for n frequencies.
-        meanPhase : ndarray, shape(n, 2, 1)
+        meanPhase : ndarray, shape(n, 2)
             The average of the magnitudes of the two transfer functions for n
             frequencies.
-        stdPhase : ndarray, shape(n, 2, 1)
+        stdPhase : ndarray, shape(n, 2)
             The standard deviation of the magnitudes of the two transfer
             functions for n frequencies.
 
         """
 
-        df = self.subset(**kwargs)
+        w = kwargs.pop('w', None)
+
+        indices = self._select(**kwargs)
+        df = self.dataFrame[indices]
         meanSpeed = df['ActualSpeed'].mean()
         stdSpeed = df['ActualSpeed'].std()
 
-        indices = self.dataFrame['RunID'].isin(df['RunID'])
-
-        subMags = self.magnitudes[indices]
-        subPhases = self.phases[indices]
+        if w is None:
+            # only the selected rows are read if the arrays are memory mapped
+            subMags = self.magnitudes[indices]
+            subPhases = self.phases[indices]
+        else:
+            subMags, subPhases = self.bode(self.poles[indices],
+                    self.residues[indices], w)
 
         # if the phase curve is in the 0 to 2 * pi region, shift it into the 0
         # to - 2 * pi region
@@ -168,15 +421,12 @@ class ExperimentalData(object):
                     #subPhases[i, j, :] = subPhases[i, j, :] - 2 * np.pi
 
         matchFreq = 0.1
-        matchPhase = -np.pi * np.ones((2, 1))
+        matchPhase = -np.pi * np.ones(2)
 
-        adjustedSubPhases = np.zeros_like(subPhases)
-        for i, run in enumerate(subPhases):
-            firstPhase = run[0, :, :]
-            correctPhase = np.mod(firstPhase, 2 * np.pi)
-            changeInPhase = firstPhase - correctPhase
-            for j, freq in enumerate(run):
-                adjustedSubPhases[i, j] = freq - changeInPhase - 2 * np.pi
+        firstPhase = subPhases[:, 0, :]
+        changeInPhase = firstPhase - np.mod(firstPhase, 2 * np.pi)
+        adjustedSubPhases = (subPhases - changeInPhase[:, np.newaxis, :] -
+                2 * np.pi)
 
         # convert to dB and degrees, then calculate the mean and standard
         # deviations
@@ -194,6 +444,7 @@ class ExperimentalData(object):
 
         return meanMag, stdMag, meanPhase, stdPhase, meanSpeed, stdSpeed
 
+    @instrument.timed('data.subset')
     def subset(self, **kwargs):
         """Returns a subset of the experimental data based on the provided
         lists.
@@ -216,44 +467,93 @@ class ExperimentalData(object):
             The minimum duration of the runs.
         """
 
-        df = self.dataFrame
+        return self.dataFrame[self._select(**kwargs)]
+
+    def _select(self, **kwargs):
+        """Returns a boolean array of the rows of the data frame in the subset,
+        see subset."""
+        return self.select_rows(self.dataFrame, **kwargs)
 
-        for col in ['Rider', 'Maneuver', 'Environment']:
-            if col in kwargs.keys():
-                # todo: The first if is for the spelling error in the data and
-                # the second is just because I wrote Treadmill everwhere else,
-                # forgetting that the data is "Horse Treadmill".
-                if col == 'Environment' and 'Pavilion' in kwargs[col]:
-                    kwargs[col].append('Pavillion Floor')
-                if col == 'Environment' and 'Treadmill' in kwargs[col]:
-                    kwargs[col].append('Horse Treadmill')
-                df = df[df[col].isin(kwargs[col])]
+    @classmethod
+    def subset_conditions(cls, **kwargs):
+        """Returns the conditions that select a subset of the runs, see
+        subset.
 
-        if 'Speed' in kwargs.keys():
-            allSpeeds = set(['1.4', '2.0', '3.0', '4.0', '4.92', '5.8', '7.0', '9.0'])
-            for speed in allSpeeds.difference(set(kwargs['Speed'])):
-                df = df[abs(df['Speed'] - float(speed)) > 1e-5]
+        Returns
+        -------
+        values : dictionary
+            The allowed values of the Rider, Maneuver and Environment columns
+            in the subset, the database environment labels are normalized.
+        excluded : list
+            The speeds of the bins that aren't in the subset, in increasing
+            order. Runs within speedTolerance of them are removed and runs
+            with speeds between the bins are kept.
+        thresholds : dictionary
+            The MeanFit and Duration values that the runs must be greater
+            than.
 
+        """
+
+        values = {}
+        for col in cls.categoricalCols:
+            if col in kwargs:
+                values[col] = list(kwargs[col])
+                if col == 'Environment':
+                    # the database labels are accepted too
+                    values[col] = [cls.environments.get(v, v) for v in
+                            values[col]]
+
+        excluded = []
+        if 'Speed' in kwargs:
+            excluded = sorted(float(s) for s in
+                    set(cls.speedBins).difference(kwargs['Speed']))
+
+        thresholds = {}
         for col in ['MeanFit', 'Duration']:
-            if col in kwargs.keys():
-                df = df[df[col] > kwargs[col]]
+            if col in kwargs:
+                thresholds[col] = float(kwargs[col])
 
         # todo: add the ability to slice with respect to the individual fits
 
-        return df
+        return values, excluded, thresholds
 
-    def load_eig_data(self):
+    @classmethod
+    def select_rows(cls, frame, **kwargs):
+        """Returns a boolean array of the rows of a data frame in a subset.
 
-        self.eig = np.zeros((self.stateMatrices.shape[0], 4),
-                dtype=np.complex64)
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            A frame with the columns of the conditions, e.g. the runs or the
+            cells of an aggregate.CoefficientSummary.
+        kwargs
+            The subset, see subset.
 
-        for i, A in enumerate(self.stateMatrices):
-            self.eig[i] = np.linalg.eig(A)[0]
+        """
 
-    def subset_eig(self, **kwargs):
+        values, excluded, thresholds = cls.subset_conditions(**kwargs)
+
+        selected = np.ones(len(frame), dtype=bool)
+
+        for col, allowed in values.items():
+            selected &= frame[col].isin(allowed).values
+
+        if len(excluded) > 0:
+            selected &= ~(np.abs(frame['Speed'].values[:, np.newaxis] -
+                np.array(excluded)) <= cls.speedTolerance).any(axis=1)
+
+        for col, threshold in thresholds.items():
+            selected &= frame[col].values > threshold
 
-        df = self.subset(**kwargs)
+        return selected
+
+    def load_eig_data(self):
+
+        self.eig = self.poles.astype(np.complex64)
+
+    @instrument.timed('data.subset_eig')
+    def subset_eig(self, **kwargs):
 
-        indices = self.dataFrame['RunID'].isin(df['RunID'])
+        indices = self._select(**kwargs)
 
-        return df['ActualSpeed'], self.eig[indices]
+        return self.dataFrame['ActualSpeed'][indices], self.eig[indices]
@@ -0,0 +1,275 @@
+"""Writes the identified and first principles model results to Parquet
+datasets that other tools can read without loading the system identification
+results.
+
+An export directory holds two datasets:
+
+runs
+    A row for each run with the ExperimentalData data frame columns, the
+    eigenvalues as EigReal1-4 and EigImag1-4 and, if exported, the Bode
+    magnitude and phase of each output as fixed size list columns, e.g.
+    PhiMagnitude. The Bode frequencies are stored in the schema metadata.
+models
+    The first principles model matrices for a sweep of speeds, a row for each
+    rider and speed.
+
+Both are partitioned by rider (and the runs by maneuver), so readers that
+filter on those columns only open the matching files and filters on the other
+columns are checked against the row group statistics, e.g.::
+
+    runs = export.read_runs('results', columns=['RunID', 'a31'],
+        filters=export.subset_filters(Rider=['Jason'], MeanFit=40.))
+
+Requires pyarrow.
+
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+
+import data
+import instrument
+
+runPartitions = ['Rider', 'Maneuver']
+modelPartitions = ['Rider']
+outputs = ['Phi', 'Delta']
+
+def _arrow():
+    """Returns the pyarrow and pyarrow.parquet modules."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Exporting results requires pyarrow.')
+    return pyarrow, pyarrow.parquet
+
+def _write(table, directory, partitions):
+    """Replaces the dataset in directory with a table."""
+    pa, pq = _arrow()
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    pq.write_to_dataset(table, directory, partition_cols=partitions)
+
+@instrument.timed('export.write_runs')
+def write_runs(data, directory, bode=True):
+    """Writes the runs of an ExperimentalData to the runs dataset.
+
+    Parameters
+    ----------
+    data : data.ExperimentalData
+        The identified runs.
+    directory : string
+        The export directory, an existing runs dataset is replaced.
+    bode : boolean, optional
+        If False the Bode data isn't written.
+
+    """
+
+    pa, pq = _arrow()
+
+    columns = {}
+    for col in data.dataFrame.columns:
+        columns[col] = pa.array(np.asarray(data.dataFrame[col]))
+
+    eig = np.asarray(data.eig)
+    for i in range(eig.shape[1]):
+        columns['EigReal' + str(i + 1)] = pa.array(eig[:, i].real)
+        columns['EigImag' + str(i + 1)] = pa.array(eig[:, i].imag)
+
+    metadata = {'outputs': outputs}
+
+    if bode:
+        numFreqs = len(data.w)
+        for name, values in [('Magnitude', data.magnitudes), ('Phase',
+            data.phases)]:
+            values = np.asarray(values, dtype=np.float32)
+            for j, output in enumerate(outputs):
+                columns[output + name] = pa.FixedSizeListArray.from_arrays(
+                    pa.array(np.ascontiguousarray(values[:, :, j]).ravel()),
+                    numFreqs)
+        metadata['w'] = list(np.asarray(data.w, dtype=float))
+
+    table = pa.table(columns, metadata={'bicycleid':
+        json.dumps(metadata)})
+
+    _write(table, os.path.join(directory, 'runs'), runPartitions)
+
+@instrument.timed('export.write_models')
+def write_models(models, speeds, directory):
+    """Writes the model matrices for a sweep of speeds to the models
+    dataset.
+
+    Parameters
+    ----------
+    models : dictionary
+        The FirstPrinciplesModel of each rider.
+    speeds : array_like, shape(n,)
+        The speeds in meters per second.
+    directory : string
+        The export directory, an existing models dataset is replaced.
+
+    """
+
+    import pandas
+
+    pa, pq = _arrow()
+
+    frames = []
+    for rider, mod in sorted(models.items()):
+        frame = mod.matrices(speeds)
+        frame['Rider'] = rider
+        frames.append(frame)
+
+    table = pa.Table.from_pandas(pandas.concat(frames, ignore_index=True),
+            preserve_index=False)
+
+    _write(table, os.path.join(directory, 'models'), modelPartitions)
+
+def subset_filters(**kwargs):
+    """Returns Parquet filters that select the same runs as
+    ExperimentalData.subset.
+
+    Parameters
+    ----------
+    kwargs
+        Rider, Maneuver, Environment and Speed lists and a MeanFit or
+        Duration threshold, see ExperimentalData.subset.
+
+    Returns
+    -------
+    filters : list
+        The filters in disjunctive normal form, a list of lists of
+        conditions, or None if there aren't any. Unlike subset, runs with a
+        nan Speed aren't selected when Speed is given.
+
+    """
+
+    values, excluded, thresholds = \
+            data.ExperimentalData.subset_conditions(**kwargs)
+    tolerance = data.ExperimentalData.speedTolerance
+
+    conditions = [(col, 'in', allowed) for col, allowed in values.items()]
+    conditions += [(col, '>', threshold) for col, threshold in
+            thresholds.items()]
+
+    # subset removes the runs in the speed bins that aren't selected and
+    # keeps the speeds between the bins, so there is a conjunction for each
+    # interval between the excluded bins
+    intervals = [[]]
+    if len(excluded) > 0:
+        intervals = [[('Speed', '<', excluded[0] - tolerance)]]
+        for lower, upper in zip(excluded[:-1], excluded[1:]):
+            intervals.append([('Speed', '>', lower + tolerance),
+                ('Speed', '<', upper - tolerance)])
+        intervals.append([('Speed', '>', excluded[-1] + tolerance)])
+
+    filters = [conditions + interval for interval in intervals]
+
+    return filters if any(filters) else None
+
+@instrument.timed('export.read_runs')
+def read_runs(directory, columns=None, filters=None):
+    """Returns the runs of an export as a data frame.
+
+    Parameters
+    ----------
+    directory : string
+        The export directory.
+    columns : list, optional
+        The columns to read, defaults to all of them. Leaving out the Bode
+        columns avoids reading them.
+    filters : list, optional
+        pyarrow filters, e.g. [('Rider', 'in', ['Jason'])] or the output of
+        subset_filters, which is in disjunctive normal form.
+
+    Returns
+    -------
+    runs : pandas.DataFrame
+        The Bode columns hold an array for each run and the partition
+        columns are categorical.
+
+    """
+    pa, pq = _arrow()
+    return pq.read_table(os.path.join(directory, 'runs'), columns=columns,
+            filters=filters).to_pandas()
+
+@instrument.timed('export.read_bode')
+def read_bode(directory, filters=None):
+    """Returns the Bode data of the runs of an export.
+
+    Parameters
+    ----------
+    directory : string
+        The export directory.
+    filters : list, optional
+        See read_runs.
+
+    Returns
+    -------
+    w : ndarray, shape(f,)
+        The frequencies in radians per second.
+    runIDs : list
+        The run id of each row of the arrays.
+    magnitudes : ndarray, shape(n, f, 2)
+    phases : ndarray, shape(n, f, 2)
+        The magnitude and phase of the roll and steer angles for each run.
+
+    """
+
+    pa, pq = _arrow()
+
+    names = [o + 'Magnitude' for o in outputs] + [o + 'Phase' for o in
+            outputs]
+    path = os.path.join(directory, 'runs')
+
+    metadata = json.loads(pq.ParquetDataset(path).schema.metadata[
+        b'bicycleid'].decode())
+    if 'w' not in metadata:
+        raise ValueError('The runs in {} were exported without the Bode '
+                'data.'.format(directory))
+    w = np.array(metadata['w'])
+
+    table = pq.read_table(path, columns=['RunID'] + names, filters=filters)
+
+    def stack(names):
+        arrays = []
+        for name in names:
+            values = table.column(name).combine_chunks().flatten()
+            arrays.append(values.to_numpy().reshape((len(table), len(w))))
+        return np.dstack(arrays)
+
+    return (w, table.column('RunID').to_pylist(), stack(names[:2]),
+            stack(names[2:]))
+
+@instrument.timed('export.read_models')
+def read_models(directory, riders=None):
+    """Returns the model sweeps of an export.
+
+    Parameters
+    ----------
+    directory : string
+        The export directory.
+    riders : list, optional
+        The riders to read, defaults to all of them.
+
+    Returns
+    -------
+    models : dictionary
+        A data frame for each rider like FirstPrinciplesModel.matrices.
+
+    """
+
+    pa, pq = _arrow()
+
+    filters = None if riders is None else [('Rider', 'in', list(riders))]
+    frame = pq.read_table(os.path.join(directory, 'models'),
+            filters=filters).to_pandas()
+
+    models = {}
+    for rider, group in frame.groupby('Rider', observed=True):
+        models[str(rider)] = group.drop('Rider',
+                axis=1).sort_values('Speed').reset_index(drop=True)
+    return models
@@ -0,0 +1,195 @@
+import numpy as np
+
+import instrument
+
+def modal_form(A, B, C):
+    """Returns the pole-residue form of one or more state space systems with
+    no feed through, such that the frequency response is
+
+        H(jw) = sum_k R_k / (jw - p_k)
+
+    Parameters
+    ----------
+    A : ndarray, shape(..., n, n)
+        The state matrices.
+    B : ndarray, shape(..., n, m)
+        The input matrices.
+    C : ndarray, shape(p, n) or shape(..., p, n)
+        The output matrices.
+
+    Returns
+    -------
+    poles : ndarray, shape(..., n)
+        The eigenvalues of the state matrices.
+    residues : ndarray, shape(..., n, p, m)
+        The residue matrix of each pole.
+
+    Notes
+    -----
+    The state matrices must be diagonalizable, the residues of systems with
+    nearly repeated eigenvalues are large and lose precision. The poles and
+    residues of systems with nan or infinite entries are nan.
+
+    """
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+
+    # eig can't handle nan, so those systems are swapped for zeros
+    finite = np.logical_and(np.isfinite(A).all(axis=(-2, -1)),
+            np.isfinite(B).all(axis=(-2, -1)))
+    A = np.where(finite[..., np.newaxis, np.newaxis], A, 0.)
+
+    poles, V = np.linalg.eig(A)
+    # the rows of the inverse are the left eigenvectors
+    CV = np.matmul(C, V)
+    WB = np.matmul(np.linalg.inv(V), B)
+    residues = (np.swapaxes(CV, -1, -2)[..., :, :, np.newaxis] *
+            WB[..., :, np.newaxis, :])
+
+    poles = np.where(finite[..., np.newaxis], poles, np.nan)
+    residues = np.where(finite[..., np.newaxis, np.newaxis, np.newaxis],
+            residues, np.nan)
+
+    return poles, residues
+
+def modal_response(poles, residues, w):
+    """Returns the frequency response of systems in pole-residue form.
+
+    Parameters
+    ----------
+    poles : ndarray, shape(..., n)
+        The poles of each system.
+    residues : ndarray, shape(..., n, p, m)
+        The residue matrix of each pole.
+    w : ndarray, shape(f,)
+        The frequencies in radians/second.
+
+    Returns
+    -------
+    H : ndarray, shape(..., f, p, m)
+        The complex response at each frequency.
+
+    """
+    s = 1j * np.asarray(w, dtype=float)
+    poles = np.asarray(poles)
+    partial = 1.0 / (s[:, np.newaxis] - poles[..., np.newaxis, :])
+    return np.einsum('...fk,...kpm->...fpm', partial, residues)
+
+def magnitude_phase(H, axis=-3):
+    """Returns the magnitude and phase of a complex response, the phase is
+    unwrapped along the frequency axis."""
+    return np.abs(H), np.unwrap(np.angle(H), axis=axis)
+
+class AdaptiveFrequencyResponse(object):
+    """Evaluates a frequency response on a coarse logarithmic grid and refines
+    it where the magnitude or phase change quickly between neighbouring
+    frequencies, i.e. near resonances and phase crossovers.
+
+    Every frequency is taken from a fixed hierarchy of grids, a coarse grid
+    with pointsPerDecade points per decade bisected in log space, and every
+    response is cached. Evaluating a different range, e.g. after zooming the
+    axis of a Bode plot, only computes the frequencies that haven't been seen
+    before.
+
+    """
+
+    def __init__(self, response, pointsPerDecade=10, magnitudeTolerance=1.0,
+            phaseTolerance=5.0, maxDepth=6):
+        """
+        Parameters
+        ----------
+        response : function
+            Takes an ndarray of f frequencies in radians/second and returns
+            the complex response as an ndarray of shape(f, ...).
+        pointsPerDecade : integer, optional
+            The density of the coarse grid.
+        magnitudeTolerance : float, optional
+            The largest change in magnitude in decibels allowed between
+            neighbouring frequencies.
+        phaseTolerance : float, optional
+            The largest change in phase in degrees allowed between
+            neighbouring frequencies.
+        maxDepth : integer, optional
+            The maximum number of times a coarse interval is bisected.
+
+        """
+
+        self.response = response
+        self.pointsPerDecade = pointsPerDecade
+        self.magnitudeTolerance = magnitudeTolerance
+        self.phaseTolerance = phaseTolerance
+        self.maxDepth = maxDepth
+
+        # responses keyed by the grid index, log10(w) * pointsPerDecade *
+        # 2**maxDepth, which is an integer for every grid frequency
+        self.cache = {}
+        self.numEvaluations = 0
+
+    def _lookup(self, index):
+        """Returns the responses at the grid indices, computing the ones that
+        aren't cached."""
+
+        missing = [i for i in index if i not in self.cache]
+        instrument.count('frequency.adaptive.hit', len(index) - len(missing))
+        instrument.count('frequency.adaptive.miss', len(missing))
+        if missing:
+            w = self.frequencies(np.array(missing))
+            for i, h in zip(missing, self.response(w)):
+                self.cache[i] = h
+            self.numEvaluations += len(missing)
+
+        return np.array([self.cache[i] for i in index])
+
+    def frequencies(self, index):
+        """Returns the frequencies in radians/second of grid indices."""
+        return 10.0**(np.asarray(index, dtype=float) /
+                (self.pointsPerDecade * 2**self.maxDepth))
+
+    @instrument.timed('frequency.adaptive')
+    def evaluate(self, wMin, wMax):
+        """Returns the refined frequencies and responses that span a frequency
+        range.
+
+        Parameters
+        ----------
+        wMin : float
+            The lower frequency in radians/second.
+        wMax : float
+            The upper frequency in radians/second.
+
+        Returns
+        -------
+        w : ndarray, shape(f,)
+            The frequencies, increasing in value.
+        H : ndarray, shape(f, ...)
+            The complex response at each frequency.
+
+        """
+
+        step = 2**self.maxDepth
+        first = int(np.floor(np.log10(wMin) * self.pointsPerDecade)) * step
+        last = int(np.ceil(np.log10(wMax) * self.pointsPerDecade)) * step
+        index = list(range(first, last + 1, step))
+
+        while True:
+            H = self._lookup(index)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = H[1:] / H[:-1]
+                ratio = ratio.reshape((len(ratio), -1))
+                magChange = np.abs(20.0 * np.log10(np.abs(ratio))).max(axis=1)
+                phaseChange = np.abs(np.rad2deg(np.angle(ratio))).max(axis=1)
+
+            spacing = np.diff(index)
+            refine = np.logical_and(spacing > 1,
+                    np.logical_or(magChange > self.magnitudeTolerance,
+                                  phaseChange > self.phaseTolerance))
+
+            if not refine.any():
+                break
+
+            midpoints = [(index[i] + index[i + 1]) // 2 for i in
+                    np.nonzero(refine)[0]]
+            index = sorted(index + midpoints)
+
+        return self.frequencies(index), H
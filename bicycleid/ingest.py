@@ -0,0 +1,114 @@
+import os
+import glob
+import time
+
+class ResultWatcher(object):
+    """Watches a directory of system identification result files and adds the
+    runs from new or modified files to an ExperimentalData object."""
+
+    pattern = '*.mat'
+    # seconds a file must be left untouched before it is read, so that files
+    # still being written are not parsed
+    settleTime = 2.0
+
+    def __init__(self, data, directory=None):
+        """
+        Parameters
+        ----------
+        data : data.ExperimentalData
+            The data to append the new runs to.
+        directory : string, optional
+            The directory to watch, defaults to the data source's results
+            directory.
+
+        """
+
+        self.data = data
+
+        if directory is None:
+            self.directory = data.source.results
+        else:
+            self.directory = directory
+
+        # the modification time of each file that has been read
+        self.seen = {}
+        self.callbacks = []
+        self.numHeldBack = 0
+
+    def connect(self, callback):
+        """Registers a function to be called with a pandas.DataFrame of the
+        added runs each time new runs are ingested."""
+        self.callbacks.append(callback)
+
+    def new_files(self):
+        """Returns a list of the files in the directory that have not been
+        read since they were last modified."""
+
+        if not os.path.isdir(self.directory):
+            return []
+
+        now = time.time()
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.directory,
+                self.pattern))):
+            path = os.path.abspath(path)
+            if (self.data.fileName is not None and
+                    path == os.path.abspath(self.data.fileName)):
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                # the file was removed after the directory was listed
+                continue
+            if self.seen.get(path) != mtime and now - mtime > self.settleTime:
+                files.append(path)
+
+        return files
+
+    def poll(self):
+        """Reads any new result files, appends their runs to the data and
+        notifies the callbacks.
+
+        Returns
+        -------
+        new : list
+            A list of pandas.DataFrame, one for each file that added runs.
+
+        """
+
+        # the files with runs that were held back until the run table has
+        # them are read again
+        heldBack = set(f for f in self.data.heldBack.values() if f is not
+                None)
+        paths = self.new_files()
+        paths += sorted(heldBack.difference(paths))
+
+        new = []
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                # the file was removed
+                continue
+            try:
+                runs = self.data.append(path)
+            except Exception as e:
+                # a broken file must not stop the files after it or the
+                # caller's polling loop
+                print('Could not read {}: {!r}'.format(path, e))
+            else:
+                if len(runs) > 0:
+                    new.append(runs)
+            # don't retry a broken file until it is modified again
+            self.seen[path] = mtime
+
+        if len(self.data.heldBack) != self.numHeldBack:
+            self.numHeldBack = len(self.data.heldBack)
+            print('{} runs are held back until they are in the run '
+                    'table.'.format(self.numHeldBack))
+
+        for runs in new:
+            for callback in self.callbacks:
+                callback(runs)
+
+        return new
@@ -0,0 +1,155 @@
+"""Named timers and counters for profiling the stages of BicycleID.
+
+Instrumentation is off unless the BICYCLEID_PROFILE environment variable is
+set when the modules are imported. Set it to 1 to print a summary table when
+the program exits, or to a path ending in .json to also write the report to
+that file::
+
+    $ BICYCLEID_PROFILE=profile.json python main.py
+
+When it is off the timed decorator returns the function unchanged and timer
+returns a shared do nothing context manager, so the cost is negligible.
+
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+setting = os.environ.get('BICYCLEID_PROFILE', '')
+enabled = setting not in ('', '0')
+
+_lock = threading.Lock()
+# timer name -> [calls, total, minimum, maximum] in seconds
+_timers = {}
+# counter name -> count
+_counters = {}
+
+def _record(name, seconds):
+    with _lock:
+        try:
+            stats = _timers[name]
+        except KeyError:
+            _timers[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+
+class _Timer(object):
+    """Times the body of a with statement."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, clock() - self.start)
+        return False
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_nullTimer = _NullTimer()
+
+def timer(name):
+    """Returns a context manager that records the time spent in its body
+    under name."""
+    if enabled:
+        return _Timer(name)
+    else:
+        return _nullTimer
+
+def timed(name):
+    """Returns a decorator that records the time spent in each call of a
+    function under name."""
+
+    def decorator(func):
+        if not enabled:
+            return func
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, clock() - start)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    return decorator
+
+def count(name, n=1):
+    """Adds n to the counter name, e.g. for cache hits and misses."""
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+def reset():
+    """Clears all of the timers and counters."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+def report():
+    """Returns a dictionary with the statistics of each timer and the value
+    of each counter."""
+    with _lock:
+        timers = {}
+        for name, (calls, total, minimum, maximum) in _timers.items():
+            timers[name] = {'calls': calls,
+                            'total': total,
+                            'mean': total / calls,
+                            'min': minimum,
+                            'max': maximum}
+        return {'timers': timers, 'counters': dict(_counters)}
+
+def write_json(fileName):
+    """Writes the report to a JSON file."""
+    with open(fileName, 'w') as f:
+        json.dump(report(), f, indent=2, sort_keys=True)
+
+def summary():
+    """Returns the report as a table, the timers sorted by total time."""
+
+    r = report()
+
+    lines = ['{:<36} {:>8} {:>12} {:>12} {:>12}'.format('Timer', 'Calls',
+        'Total (s)', 'Mean (s)', 'Max (s)')]
+    for name, s in sorted(r['timers'].items(), key=lambda x: -x[1]['total']):
+        lines.append('{:<36} {:>8} {:>12.4f} {:>12.6f} {:>12.6f}'.format(name,
+            s['calls'], s['total'], s['mean'], s['max']))
+
+    if r['counters']:
+        lines.append('')
+        lines.append('{:<36} {:>8}'.format('Counter', 'Count'))
+        for name, n in sorted(r['counters'].items()):
+            lines.append('{:<36} {:>8}'.format(name, n))
+
+    return '\n'.join(lines)
+
+def _exit_report():
+    print(summary())
+    if setting.endswith('.json'):
+        write_json(setting)
+
+if enabled:
+    atexit.register(_exit_report)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import os
+
 import pygtk
 pygtk.require("2.0")
 
@@ -8,13 +10,20 @@ matplotlib.use('GTK')
 
 import gtk
 import gtk.glade
+import gobject
 
 import numpy as np
 
 # local dependencies
+import aggregate
 import data
-import model
+import ingest
+import instrument
 import plot
+import registry
+import server
+import sources
+import storage
 
 # debugging
 try:
@@ -39,7 +48,10 @@ class Gui:
 
     bodeFrequency = np.logspace(-1, 2., num=200)
     eigSpeed = np.linspace(0., 10., num=100)
+    # milliseconds between checks for new system identification results
+    resultPollInterval = 5000
 
+    @instrument.timed('gui.startup')
     def __init__(self):
 
         fileName = "BicycleID.glade"
@@ -51,15 +63,49 @@ class Gui:
         # set the default toggle button states
         self.get_toggle_button_states()
 
-        # load the initial experimental data
-        print('Loading the experimental data...')
-        self.data = data.ExperimentalData(w=self.bodeFrequency)
-        # load all the rider models
-        print('Loading the first principles models...')
-        self.models = {}
-        for r in self.riders:
-            rider = r.capitalize()
-            self.models[rider] = model.Whipple(rider)
+        source = sources.default_source()
+
+        client = None
+        if os.path.exists(source.dataServer):
+            # share the data and models loaded by a running data server
+            print('Connecting to the data server...')
+            try:
+                client = server.DataClient(source.dataServer)
+            except (IOError, OSError, EOFError,
+                    server.AuthenticationError) as e:
+                # the socket is left by a server that didn't shut down
+                # cleanly, the next server removes it, or the key file
+                # can't be read
+                print('Could not connect to the data server at {} ({}), '
+                        'loading the data locally.'.format(
+                            source.dataServer, e))
+
+        if client is not None:
+            self.data = client
+            self.bodeFrequency = client.w
+            self.models = {}
+            for r in self.riders:
+                rider = r.capitalize()
+                self.models[rider] = server.RemoteWhipple(client, rider)
+            self.watcher = server.ServerWatcher(client)
+        else:
+            # build the rider models in worker processes while the
+            # experimental data loads
+            print('Loading the first principles models...')
+            self.registry = registry.ModelRegistry(source)
+            self.registry.submit_all([r.capitalize() for r in self.riders])
+            # load the initial experimental data
+            print('Loading the experimental data...')
+            bodeStore = storage.BodeStore(source.bodeStore,
+                    self.bodeFrequency, key=source.key())
+            self.data = data.ExperimentalData(w=self.bodeFrequency,
+                    bodeStore=bodeStore, source=source)
+            self.models = self.registry.models()
+            self.registry.shutdown()
+            self.watcher = ingest.ResultWatcher(self.data)
+
+        # the coefficient statistics of every combination of the toggles
+        self.summary = aggregate.CoefficientSummary(self.data.dataFrame)
 
         self.update_coef_data()
 
@@ -74,6 +120,10 @@ class Gui:
         # update the coef graph with initial data
         self.update_coef_graph()
 
+        # watch for new system identification results
+        self.watcher.connect(self.add_new_results)
+        gobject.timeout_add(self.resultPollInterval, self.poll_results)
+
         dic = {
             'on_mainWindow_destroy' : gtk.main_quit,
             'on_charlieButton_toggled': self.change_toggle_state,
@@ -105,6 +155,7 @@ class Gui:
 
     ## Callbacks ##
 
+    @instrument.timed('gui.change_plot')
     def change_plot(self, notebook, page, pageNum):
         currentPage = notebook.get_nth_page(pageNum)
         name = gtk.Buildable.get_name(currentPage)
@@ -121,6 +172,7 @@ class Gui:
         else:
             raise Exception('No plot named {}.'.format(name))
 
+    @instrument.timed('gui.change_parameter')
     def change_parameter(self, widget):
         name = gtk.Buildable.get_name(widget).split('_')[0]
         add = widget.get_value()
@@ -132,6 +184,7 @@ class Gui:
 
         # todo: make this bode plot aware
 
+    @instrument.timed('gui.update_mean_fit')
     def update_mean_fit(self, widget):
         """Callback for adjusting the mean fit spin button."""
         plotTab = self.get_current_plot_tab()
@@ -148,6 +201,7 @@ class Gui:
         else:
             raise Exception('No tab named {}.'.format(plotTab))
 
+    @instrument.timed('gui.change_toggle_state')
     def change_toggle_state(self, widget):
         """The callback for the factor toggle buttons."""
         name = gtk.Buildable.get_name(widget)
@@ -172,6 +226,36 @@ class Gui:
         else:
             raise Exception('No tab named {}.'.format(plotTab))
 
+    @instrument.timed('gui.poll_results')
+    def poll_results(self):
+        """Timeout callback that checks for new system identification
+        results."""
+        self.watcher.poll()
+        # keep the timeout running
+        return True
+
+    @instrument.timed('gui.add_new_results')
+    def add_new_results(self, runs):
+        """Redraws the current plot when new runs are added to the
+        data."""
+        print('Added {} new runs.'.format(len(runs)))
+
+        self.summary.update(runs)
+
+        plotTab = self.get_current_plot_tab()
+
+        if plotTab == 'coefTab':
+            self.update_coef_data()
+            self.update_coef_graph()
+        elif plotTab == 'bodeTab':
+            self.update_bode_data()
+            self.update_bode_plot()
+        elif plotTab == 'eigTab':
+            self.update_eig_data()
+            self.update_root_loci_plot()
+        else:
+            raise Exception('No tab named {}.'.format(plotTab))
+
     ## Helper Functions ##
 
     def get_toggle_button_states(self):
@@ -227,6 +311,7 @@ class Gui:
         """Loads the subset of the experimental data."""
         self.exp = self.data.subset(**self.subsetDict)
 
+    @instrument.timed('gui.load_mod_data')
     def load_mod_data(self):
         """Computes the model output data for each rider and stores it in
         self.mod."""
@@ -252,7 +337,10 @@ class Gui:
         """Redraws the plot based on the current experimental and model
         data frames."""
         self.coefPlot.update_graph(self.exp, self.modSelect)
-        self.coefPlot.canvas.draw()
+        self.coefPlot.update_summary(self.summary.summarize(groupBy='Speed',
+            **self.subsetDict))
+        with instrument.timer('gui.draw.coef'):
+            self.coefPlot.canvas.draw()
 
     ## Bode Plots ##
 
@@ -277,8 +365,9 @@ class Gui:
 
     def update_bode_plot(self):
         self.bodePlot.update_graph(self.bodeSubset, self.models)
-        self.bodePlot.canvases[0].draw()
-        self.bodePlot.canvases[1].draw()
+        with instrument.timer('gui.draw.bode'):
+            self.bodePlot.canvases[0].draw()
+            self.bodePlot.canvases[1].draw()
 
     ## Root Loci Plot ##
 
@@ -295,7 +384,8 @@ class Gui:
 
     def update_root_loci_plot(self):
         self.rootLociPlot.update_plot(self.expEigSpeed, self.eigSubset)
-        self.rootLociPlot.canvas.draw()
+        with instrument.timer('gui.draw.eig'):
+            self.rootLociPlot.canvas.draw()
 
     ## Model Parameters ##
 
@@ -0,0 +1,213 @@
+"""Scores the mismatch between each identified run and the Whipple model
+evaluated at the run's own speed in the frequency domain.
+
+For the steer torque to roll angle and steer angle transfer functions of each
+run, with H the identified and G the Whipple frequency response, the metrics
+are
+
+MagnitudeError
+    The weighted root mean square of 20 log10(|H| / |G|) in decibels.
+PhaseError
+    The weighted root mean square of the phase of H / G, wrapped to +/-180
+    degrees, so the unwrapping of the two curves doesn't matter.
+H2
+    The H2 norm of H - G, approximated by the trapezoidal rule over the
+    frequencies, so it only covers the frequency band.
+Hinf
+    The largest magnitude of H - G at the frequencies.
+
+The weights default to equal weight per decade. The Whipple poles and residues
+of every run are computed with one vectorized sweep per rider and the
+responses are evaluated in chunks of runs, so the whole data set is scored
+without a loop over the runs.
+
+"""
+
+import numpy as np
+import pandas
+
+import frequency
+import instrument
+
+outputs = ['Phi', 'Delta']
+names = ['MagnitudeError', 'PhaseError', 'H2', 'Hinf']
+
+def trapezoid_weights(x):
+    """Returns the weights of the trapezoidal rule for samples at x."""
+    weights = np.zeros(len(x))
+    weights[1:] += np.diff(x) / 2.
+    weights[:-1] += np.diff(x) / 2.
+    return weights
+
+def frequency_weights(w):
+    """Returns weights that give each decade of w equal weight and sum to
+    one."""
+    weights = trapezoid_weights(np.log10(w))
+    return weights / weights.sum()
+
+@instrument.timed('metrics.whipple_modal_form')
+def whipple_modal_form(data, models):
+    """Returns the pole-residue form of the Whipple model of each run at the
+    run's speed.
+
+    Parameters
+    ----------
+    data : data.ExperimentalData
+        The identified runs.
+    models : dictionary
+        The FirstPrinciplesModel of each rider.
+
+    Returns
+    -------
+    poles : ndarray, shape(n, 4)
+    residues : ndarray, shape(n, 4, 2)
+        The poles and residues of each run, nan for the runs of riders that
+        don't have a model.
+
+    """
+
+    numRuns = len(data.dataFrame)
+    poles = np.nan * np.ones((numRuns, 4), dtype=complex)
+    residues = np.nan * np.ones((numRuns, 4, 2), dtype=complex)
+
+    riders = data.dataFrame['Rider'].values
+    speeds = data.dataFrame['ActualSpeed'].values
+
+    for rider, mod in models.items():
+        runs = np.nonzero(riders == rider)[0]
+        if len(runs) > 0:
+            A, B = mod.state_spaces(speeds[runs])
+            poles[runs], residues[runs] = data.modal_form(A, B)
+
+    return poles, residues
+
+@instrument.timed('metrics.compare')
+def compare(data, models, w=None, weights=None, chunkSize=1000):
+    """Returns the frequency domain mismatch metrics of every run.
+
+    Parameters
+    ----------
+    data : data.ExperimentalData
+        The identified runs.
+    models : dictionary
+        The FirstPrinciplesModel of each rider.
+    w : ndarray, shape(f,), optional
+        The frequencies in radians per second, defaults to data.w.
+    weights : ndarray, shape(f,), optional
+        The weight of each frequency in the magnitude and phase errors,
+        defaults to frequency_weights(w).
+    chunkSize : integer, optional
+        The number of runs evaluated at a time.
+
+    Returns
+    -------
+    metrics : pandas.DataFrame
+        A row for each run, in the order of data.dataFrame, with the RunID
+        and a column for each output and metric, e.g. PhiMagnitudeError, and
+        the mean of the two outputs, e.g. MeanMagnitudeError. The metrics of
+        runs without a rider model are nan.
+
+    """
+
+    if w is None:
+        w = data.w
+    w = np.asarray(w, dtype=float)
+
+    if weights is None:
+        weights = frequency_weights(w)
+    weights = np.asarray(weights, dtype=float) / np.sum(weights)
+
+    bandWeights = trapezoid_weights(w) / np.pi
+
+    modelPoles, modelResidues = whipple_modal_form(data, models)
+
+    numRuns = len(data.dataFrame)
+    results = {name: np.zeros((numRuns, 2)) for name in names}
+
+    for start in range(0, numRuns, chunkSize):
+        chunk = slice(start, start + chunkSize)
+
+        # the runs without a model are nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            with instrument.timer('metrics.response'):
+                # shape(runs, f, 2)
+                H = frequency.modal_response(data.poles[chunk],
+                        data.residues[chunk][..., np.newaxis], w)[..., 0]
+                G = frequency.modal_response(modelPoles[chunk],
+                        modelResidues[chunk][..., np.newaxis], w)[..., 0]
+
+            ratio = H / G
+            magnitude = 20. * np.log10(np.abs(ratio))
+            phase = np.rad2deg(np.angle(ratio))
+            difference = np.abs(H - G)
+
+            results['MagnitudeError'][chunk] = np.sqrt(np.einsum('f,nfo->no',
+                weights, magnitude**2))
+            results['PhaseError'][chunk] = np.sqrt(np.einsum('f,nfo->no',
+                weights, phase**2))
+            # ||H - G||^2 = 1 / pi int_0^inf |H - G|^2 dw
+            results['H2'][chunk] = np.sqrt(np.einsum('f,nfo->no',
+                bandWeights, difference**2))
+            results['Hinf'][chunk] = difference.max(axis=1)
+
+    d = {'RunID': data.dataFrame['RunID'].values}
+    for name, values in results.items():
+        for j, output in enumerate(outputs):
+            d[output + name] = values[:, j]
+        d['Mean' + name] = values.mean(axis=1)
+
+    columns = ['RunID'] + [o + n for n in names for o in outputs + ['Mean']]
+
+    return pandas.DataFrame(d, index=data.dataFrame.index, columns=columns)
+
+def rank(metrics, by='MeanMagnitudeError', number=None):
+    """Returns the runs sorted from the largest to the smallest mismatch.
+
+    Parameters
+    ----------
+    metrics : pandas.DataFrame
+        The output of compare.
+    by : string, optional
+        The metric column to sort by.
+    number : integer, optional
+        The number of runs to return, defaults to all of them.
+
+    """
+    ranked = metrics.sort_values(by, ascending=False, na_position='last')
+    if number is not None:
+        ranked = ranked.iloc[:number]
+    return ranked
+
+def rank_subsets(data, metrics, groupBy=('Rider', 'Maneuver', 'Environment',
+    'Speed'), by='MeanMagnitudeError'):
+    """Returns the mean metrics of groups of runs sorted from the largest to
+    the smallest mismatch.
+
+    Parameters
+    ----------
+    data : data.ExperimentalData
+        The identified runs that the metrics were computed for.
+    metrics : pandas.DataFrame
+        The output of compare.
+    groupBy : tuple, optional
+        The data frame columns that define the groups.
+    by : string, optional
+        The metric column to sort by.
+
+    Returns
+    -------
+    subsets : pandas.DataFrame
+        A row for each group with the number of runs and the mean of each
+        metric.
+
+    """
+
+    groupBy = list(groupBy)
+    frame = pandas.concat([data.dataFrame[groupBy], metrics.drop('RunID',
+        axis=1)], axis=1)
+    groups = frame.groupby(groupBy, observed=True)
+
+    subsets = groups.mean()
+    subsets.insert(0, 'NumRuns', groups.size())
+
+    return subsets.sort_values(by, ascending=False, na_position='last')
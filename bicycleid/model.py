@@ -1,7 +1,6 @@
 import numpy as np
 import pandas
 import bicycleparameters as bp
-from dtk import control
 
 # debugging
 try:
@@ -11,11 +10,15 @@ except ImportError:
 else:
     set_trace = Tracer()
 
-from config import PATH_TO_PARAMETERS
+import frequency
+import instrument
+import sources
 
 class FirstPrinciplesModel(object):
 
     possibleRiders = ['Charlie', 'Jason', 'Luke']
+    # the number of cached adaptive frequency responses
+    maxResponses = 64
 
     def __init__(self):
         pass
@@ -54,6 +57,7 @@ class FirstPrinciplesModel(object):
         for var, val in parDict.items():
             self.set_parameter(var, val)
 
+    @instrument.timed('model.matrices')
     def matrices(self, speedRange):
         """Returns the state and input matrices for a range of speeds.
 
@@ -71,11 +75,7 @@ class FirstPrinciplesModel(object):
             force].
 
         """
-        A = np.zeros((len(speedRange), 4, 4))
-        B = np.zeros((len(speedRange), 4, 2))
-
-        for i, speed in enumerate(speedRange):
-            A[i], B[i] = self.state_space(speed)
+        A, B = self.state_spaces(speedRange)
 
         d = {}
 
@@ -95,18 +95,109 @@ class FirstPrinciplesModel(object):
 
         return dataframe
 
+    def state_spaces(self, speeds):
+        """Returns the state and input matrices for an array of speeds.
+
+        Parameters
+        ----------
+        speeds : array_like, shape(n,)
+            The speeds in meters per second.
+
+        Returns
+        -------
+        A : ndarray, shape(n, 4, 4)
+        B : ndarray, shape(n, 4, 2)
+
+        """
+        A = np.zeros((len(speeds), 4, 4))
+        B = np.zeros((len(speeds), 4, 2))
+
+        for i, speed in enumerate(speeds):
+            A[i], B[i] = self.state_space(speed)
+
+        return A, B
+
+    def adaptive_response(self, speed):
+        """Returns an adaptive frequency response of the steer torque to roll
+        angle and steer angle transfer functions at a speed. The responses are
+        cached for each speed and set of parameters.
+
+        Parameters
+        ----------
+        speed : float
+            The speed in meters per second.
+
+        Returns
+        -------
+        response : frequency.AdaptiveFrequencyResponse
+            The evaluate method returns responses of shape(f, 2).
+
+        """
+
+        key = (float(speed), tuple(sorted(self.parameters.items())))
+
+        if not hasattr(self, 'responses'):
+            self.responses = {}
+
+        try:
+            adaptive = self.responses[key]
+        except KeyError:
+            instrument.count('model.responses.miss')
+            poles, residues = self.modal_form(speed)
+
+            def response(w):
+                return frequency.modal_response(poles, residues, w)[:, :, 0]
+
+            if len(self.responses) >= self.maxResponses:
+                self.responses.clear()
+            adaptive = frequency.AdaptiveFrequencyResponse(response)
+            self.responses[key] = adaptive
+        else:
+            instrument.count('model.responses.hit')
+
+        return adaptive
+
+    @instrument.timed('model.modal_form')
+    def modal_form(self, speed):
+        """Returns the pole-residue form of the steer torque to roll angle and
+        steer angle transfer functions at a speed.
+
+        Returns
+        -------
+        poles : ndarray, shape(4,)
+        residues : ndarray, shape(4, 2, 1)
+
+        """
+
+        A, B = self.state_space(speed)
+
+        C = np.array([[1., 0., 0., 0.],
+                      [0., 1., 0., 0.]])
+
+        return frequency.modal_form(A, B[:, :1], C)
+
+    @instrument.timed('model.magnitude_phase')
+    def magnitude_phase(self, speed, w):
+
+        H = frequency.modal_response(*self.modal_form(speed), w=w)
+        mag, phase = frequency.magnitude_phase(H)
+
+        return mag.squeeze(), phase.squeeze()
+
 class Whipple(FirstPrinciplesModel):
     """A first principles model for the Whipple model."""
 
-    parDir = PATH_TO_PARAMETERS
-
-    def __init__(self, rider):
+    @instrument.timed('model.Whipple')
+    def __init__(self, rider, source=None):
         """Sets the parameters of the model for the supplied rider.
 
         Parameters
         ----------
         rider : string
             Either `Charlie`, `Jason`, or `Luke`.
+        source : sources.DataSource, optional
+            Where the bicycle parameters are loaded from, defaults to
+            sources.default_source().
 
         """
 
@@ -119,9 +210,10 @@ class Whipple(FirstPrinciplesModel):
         else:
             self.bicycleName = 'Rigidcl'
 
-        self.bicycle = bp.Bicycle(self.bicycleName, pathToData=self.parDir,
-                forceRawCalc=True)
-        self.bicycle.add_rider(self.rider)
+        if source is None:
+            source = sources.default_source()
+
+        self.bicycle = source.bicycle(self.rider, self.bicycleName)
         self.parameters = self.bicycle.parameters['Benchmark']
         self.defaultParameters = bp.io.remove_uncertainties(self.parameters)
         self.set_default_parameters()
@@ -130,6 +222,7 @@ class Whipple(FirstPrinciplesModel):
         for k in self.parameters.keys():
             self.parameters[k] = self.defaultParameters[k]
 
+    @instrument.timed('model.state_space')
     def state_space(self, speed):
         """Returns the state and input matrix for the Whipple bicycle model.
 
@@ -147,27 +240,50 @@ class Whipple(FirstPrinciplesModel):
             The input matrix with inputs [steer torque, lateral force].
 
         """
-        # the B matrix returned is for the inputs [roll torque, steer torque]
-        A, BT = self.bicycle.state_space(speed, nominal=True)
-        if self.rider == 'Jason':
-            H = np.array([[0.943], [0.011]])
-        else:
-            H = np.array([[0.902], [0.011]])
-        BF = np.dot(BT[2:, :], H)
-        B = np.hstack((BT[:, 1].reshape(4,1), np.vstack((np.zeros((2,1)), BF))))
+        A, B = self.state_spaces([speed])
 
-        return A, B
+        return A[0], B[0]
 
-    def magnitude_phase(self, speed, w):
+    @instrument.timed('model.state_spaces')
+    def state_spaces(self, speeds):
+        """Returns the state and input matrices for the Whipple bicycle model
+        at an array of speeds. The canonical matrices are computed once and
+        the speed terms are broadcast, see bicycleparameters.bicycle.ab_matrix.
 
-        A, B = self.state_space(speed)
+        Parameters
+        ----------
+        speeds : array_like, shape(n,)
+            The speeds in meters per second.
 
-        C = np.array([[1., 0., 0., 0.],
-                      [0., 1., 0., 0.]])
-        D = np.zeros((2, 1))
+        Returns
+        -------
+        A : ndarray, shape(n, 4, 4)
+            The state matrices with states [roll angle, steer angle, roll rate,
+            steer rate].
+        B : ndarray, shape(n, 4, 2)
+            The input matrices with inputs [steer torque, lateral force].
 
-        sys = control.StateSpace(A, B.reshape(4, 1), C, D)
-        bode = control.Bode(w, sys)
-        mag, phase = bode.mag_phase_system(sys)
+        """
+        v = np.asarray(speeds, dtype=float)[:, np.newaxis, np.newaxis]
 
-        return mag.squeeze(), phase.squeeze()
+        M, C1, K0, K2 = self.bicycle.canonical(nominal=True)
+        g = self.parameters['g']
+        invM = np.linalg.inv(M)
+
+        A = np.zeros((len(v), 4, 4))
+        A[:, 0, 2] = A[:, 1, 3] = 1.
+        # stiffness based terms
+        A[:, 2:, :2] = -np.matmul(invM, g * K0 + v**2 * K2)
+        # damping based terms
+        A[:, 2:, 2:] = -np.matmul(invM, v * C1)
+
+        # the lateral force acts through the roll and steer torques
+        if self.rider == 'Jason':
+            H = np.array([0.943, 0.011])
+        else:
+            H = np.array([0.902, 0.011])
+        B = np.zeros((len(v), 4, 2))
+        B[:, 2:, 0] = invM[:, 1]
+        B[:, 2:, 1] = np.dot(invM, H)
+
+        return A, B
@@ -1,10 +1,145 @@
 import numpy as np
 from matplotlib import rc
 import matplotlib.figure as mpfig
-import matplotlib.backends.backend_gtk as mpgtk
 from dtk import control
 import bicycleparameters as bp
 
+import instrument
+
+def gtk_canvas(figure):
+    """Returns a shown GTK canvas for a figure, which the GUI packs into its
+    window."""
+    import matplotlib.backends.backend_gtk as mpgtk
+    canvas = mpgtk.FigureCanvasGTK(figure)
+    canvas.show()
+    return canvas
+
+# makes the canvas of each plot's figures, set it to e.g.
+# matplotlib.backends.backend_agg.FigureCanvasAgg to draw without a display
+canvasFactory = gtk_canvas
+
+class LevelOfDetail(object):
+    """Bounds the number of points drawn by scatter artists on an axes.
+
+    When more than maxPoints of the points are in view the artists are hidden
+    and the density of the points in view is drawn as a 2D histogram image,
+    or, if mode is 'sample', a fixed random sample of maxPoints of them is
+    drawn. The view is recomputed when the axis limits change, so zooming in
+    far enough shows the individual points again.
+
+    """
+
+    maxPoints = 5000
+    bins = (200, 150)
+
+    def __init__(self, ax, artists, maxPoints=None, bins=None, mode='density',
+            cmap='Greys'):
+        """
+        Parameters
+        ----------
+        ax : matplotlib.axes.Axes
+            The axes that holds the artists.
+        artists : list
+            Line2D or PathCollection (scatter) artists.
+        maxPoints : integer, optional
+            The most points drawn, defaults to the class attribute.
+        bins : tuple, optional
+            The number of x and y histogram bins across the view.
+        mode : string, optional
+            'density' or 'sample'.
+        cmap : string, optional
+            The color map of the density image.
+
+        """
+
+        self.ax = ax
+        self.artists = artists
+        if maxPoints is not None:
+            self.maxPoints = maxPoints
+        if bins is not None:
+            self.bins = bins
+        self.mode = mode
+
+        self.data = [(np.array([]), np.array([]), None) for a in artists]
+
+        # the extent is the current view so the axis limits don't change
+        self.image = ax.imshow(np.ma.masked_all((2, 2)), origin='lower',
+                aspect='auto', interpolation='nearest', cmap=cmap,
+                extent=ax.get_xlim() + ax.get_ylim(), zorder=0)
+        self.image.set_visible(False)
+
+        self._refreshing = False
+        ax.callbacks.connect('xlim_changed', self.refresh)
+        ax.callbacks.connect('ylim_changed', self.refresh)
+
+    def set_data(self, data):
+        """Sets the points of each artist.
+
+        Parameters
+        ----------
+        data : list
+            An (x, y) or (x, y, c) tuple for each artist, where c are the
+            scatter colors.
+
+        """
+        self.data = [(np.asarray(d[0], dtype=float), np.asarray(d[1],
+            dtype=float), d[2] if len(d) > 2 else None) for d in data]
+        self.refresh()
+
+    def _set_points(self, artist, x, y, c):
+        if hasattr(artist, 'set_offsets'):
+            artist.set_offsets(np.column_stack((x, y)))
+            if c is not None:
+                artist.set_array(c)
+        else:
+            artist.set_data(x, y)
+
+    def refresh(self, *args):
+        """Redraws the points or the density for the current view."""
+
+        # setting the image extent can set the limits, which calls this again
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        try:
+            xlim = sorted(self.ax.get_xlim())
+            ylim = sorted(self.ax.get_ylim())
+
+            inView = [(x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) &
+                    (y <= ylim[1]) for x, y, c in self.data]
+            numPoints = sum(v.sum() for v in inView)
+
+            if numPoints <= self.maxPoints or self.mode == 'sample':
+                self.image.set_visible(False)
+                # draw at most maxPoints in total, in proportion to each
+                # artist's share of the points in view
+                fraction = min(1., float(self.maxPoints) / max(numPoints, 1))
+                random = np.random.RandomState(0)
+                for artist, (x, y, c), v in zip(self.artists, self.data,
+                        inView):
+                    index = np.nonzero(v)[0]
+                    if fraction < 1.:
+                        index = np.sort(random.choice(index, int(fraction *
+                            len(index)), replace=False))
+                    self._set_points(artist, x[index], y[index], None if c is
+                            None else np.asarray(c)[index])
+                    artist.set_visible(True)
+            else:
+                x = np.hstack([d[0][v] for d, v in zip(self.data, inView)])
+                y = np.hstack([d[1][v] for d, v in zip(self.data, inView)])
+                counts = np.histogram2d(x, y, bins=self.bins,
+                        range=[xlim, ylim])[0]
+                self.image.set_data(np.ma.masked_equal(np.log1p(counts.T),
+                    0.))
+                self.image.set_extent(tuple(xlim) + tuple(ylim))
+                self.image.autoscale()
+                self.image.set_visible(True)
+                for artist in self.artists:
+                    artist.set_visible(False)
+        finally:
+            self._refreshing = False
+
 class CoefficientPlot(object):
 
     equations = [r'\dot{\phi}', r'\dot{\delta}', r'\ddot{\phi}', r'\ddot{\delta}']
@@ -51,15 +186,23 @@ class CoefficientPlot(object):
             ax.set_ylim(self.ylim[p - 1])
 
         self.lines = {}
+        self.details = {}
         for label, ax in self.axes.items():
             self.lines[label + '-exp'] = ax.plot(self.xlim, [1., 1.], '.',
                     markersize=2)[0]
+            self.details[label] = LevelOfDetail(ax, [self.lines[label +
+                '-exp']])
             for rider in self.riderNames:
                 self.lines[label + '-mod-' + rider] = ax.plot(self.xlim, [1., 1.])[0]
+            # the mean and standard deviation of each speed bin
+            self.lines[label + '-mean'] = ax.plot([np.nan], [np.nan], 'ko',
+                    markersize=4)[0]
+            self.lines[label + '-spread'] = ax.plot([np.nan], [np.nan], 'k-',
+                    linewidth=2)[0]
 
-        self.canvas = mpgtk.FigureCanvasGTK(self.figure)
-        self.canvas.show()
+        self.canvas = canvasFactory(self.figure)
 
+    @instrument.timed('plot.CoefficientPlot.update_graph')
     def update_graph(self, exp, mod):
         """Sets the data in the plot with respect to the provided experimental
         and model data sets.
@@ -82,13 +225,36 @@ class CoefficientPlot(object):
                 label, typ = name.split('-')
 
             if typ == 'exp':
-                line.set_data(exp['ActualSpeed'], exp[label])
+                self.details[label].set_data([(exp['ActualSpeed'],
+                    exp[label])])
             elif typ == 'mod':
                 try:
                     line.set_data(mod[rider]['Speed'], mod[rider][label])
                 except KeyError:
                     line.set_data([np.nan], [np.nan])
 
+    @instrument.timed('plot.CoefficientPlot.update_summary')
+    def update_summary(self, summary):
+        """Sets the mean and standard deviation of each coefficient in each
+        speed bin.
+
+        Parameters
+        ----------
+        summary : pandas.DataFrame
+            The CoefficientSummary.summarize output grouped by speed.
+
+        """
+
+        speed = summary[('ActualSpeed', 'mean')].values
+        # vertical segments separated by nans so one line draws every bin
+        x = np.column_stack((speed, speed, np.nan * speed)).flatten()
+        for label in self.axes.keys():
+            mean = summary[(label, 'mean')].values
+            std = summary[(label, 'std')].values
+            self.lines[label + '-mean'].set_data(speed, mean)
+            self.lines[label + '-spread'].set_data(x, np.column_stack((mean -
+                std, mean + std, np.nan * mean)).flatten())
+
 class BodePlot(object):
 
     inputNames = [r'$T_\delta$']
@@ -129,12 +295,15 @@ class BodePlot(object):
         self.bode.mag_phase()
         self.bode.plot()
 
+        self.models = {}
+        self.meanSpeed = np.nan
+
         self.canvases = []
         for fig in self.bode.figs:
-            canvas = mpgtk.FigureCanvasGTK(fig)
-            self.canvases.append(canvas)
-            canvas.show()
+            fig.magAx.callbacks.connect('xlim_changed', self.update_models)
+            self.canvases.append(canvasFactory(fig))
 
+    @instrument.timed('plot.BodePlot.update_graph')
     def update_graph(self, bodeData, models):
         """Updates the Bode plot based on the provided data.
 
@@ -154,49 +323,68 @@ class BodePlot(object):
 
         # steer torque to roll angle
         phiPlot = self.bode.figs[0]
-        phiPlot.magAx.lines[0].set_ydata(meanMag[:, 0, 0])
-        phiPlot.magAx.lines[1].set_ydata(meanMagPlus[:, 0, 0])
-        phiPlot.magAx.lines[2].set_ydata(meanMagMinus[:, 0, 0])
+        phiPlot.magAx.lines[0].set_ydata(meanMag[:, 0])
+        phiPlot.magAx.lines[1].set_ydata(meanMagPlus[:, 0])
+        phiPlot.magAx.lines[2].set_ydata(meanMagMinus[:, 0])
         phiPlot.magAx.set_ylim((-100, 50))
 
-        phiPlot.phaseAx.lines[0].set_ydata(meanPhase[:, 0, 0])
-        phiPlot.phaseAx.lines[1].set_ydata(meanPhase[:, 0, 0] + stdPhase[:, 0, 0])
-        phiPlot.phaseAx.lines[2].set_ydata(meanPhase[:, 0, 0] - stdPhase[:, 0, 0])
+        phiPlot.phaseAx.lines[0].set_ydata(meanPhase[:, 0])
+        phiPlot.phaseAx.lines[1].set_ydata(meanPhase[:, 0] + stdPhase[:, 0])
+        phiPlot.phaseAx.lines[2].set_ydata(meanPhase[:, 0] - stdPhase[:, 0])
         phiPlot.phaseAx.set_ylim((-360, 0))
 
         # steer torque to steer angle
         deltaPlot = self.bode.figs[1]
-        deltaPlot.magAx.lines[0].set_ydata(meanMag[:, 1, 0])
-        deltaPlot.magAx.lines[1].set_ydata(meanMagPlus[:, 1, 0])
-        deltaPlot.magAx.lines[2].set_ydata(meanMagMinus[:, 1, 0])
+        deltaPlot.magAx.lines[0].set_ydata(meanMag[:, 1])
+        deltaPlot.magAx.lines[1].set_ydata(meanMagPlus[:, 1])
+        deltaPlot.magAx.lines[2].set_ydata(meanMagMinus[:, 1])
         deltaPlot.magAx.set_ylim((-100, 50))
 
-        deltaPlot.phaseAx.lines[0].set_ydata(meanPhase[:, 1, 0])
-        deltaPlot.phaseAx.lines[1].set_ydata(meanPhase[:, 1, 0] + stdPhase[:, 1, 0])
-        deltaPlot.phaseAx.lines[2].set_ydata(meanPhase[:, 1, 0] - stdPhase[:, 1, 0])
+        deltaPlot.phaseAx.lines[0].set_ydata(meanPhase[:, 1])
+        deltaPlot.phaseAx.lines[1].set_ydata(meanPhase[:, 1] + stdPhase[:, 1])
+        deltaPlot.phaseAx.lines[2].set_ydata(meanPhase[:, 1] - stdPhase[:, 1])
         deltaPlot.phaseAx.set_ylim((-360, 0))
 
-        for rider in ['Charlie', 'Jason', 'Luke']:
-            try:
-                mod = models[rider]
-            except KeyError:
-                # if the rider isn't there, don't plot the lines
-                lenW = len(deltaPlot.magAx.lines[0].get_xdata())
-                mag = np.nan * np.ones((lenW, 2))
-                phase = np.nan * np.ones((lenW, 2))
-            else:
-                mag, phase = mod.magnitude_phase(meanSpeed, self.w)
-                mag = 20. * np.log10(mag)
-                phase = np.rad2deg(phase)
-
-                for i, p in enumerate(phase.T):
-                    if p[0] > 0.:
-                        phase[:, i] = phase[:, i] - 360.
-
-            phiPlot.magAx.lines[self.systemNames.index(rider)].set_ydata(mag[:, 0])
-            phiPlot.phaseAx.lines[self.systemNames.index(rider)].set_ydata(phase[:, 0])
-            deltaPlot.magAx.lines[self.systemNames.index(rider)].set_ydata(mag[:, 1])
-            deltaPlot.phaseAx.lines[self.systemNames.index(rider)].set_ydata(phase[:, 1])
+        self.models = models
+        self.meanSpeed = meanSpeed
+
+        self.update_models()
+
+    @instrument.timed('plot.BodePlot.update_models')
+    def update_models(self, *args):
+        """Sets the model lines to the adaptively refined responses at the
+        mean speed over the visible frequency range of each figure. This is
+        also called when the frequency axis limits change, e.g. by zooming,
+        and only computes the responses at newly visible frequencies."""
+
+        for i, fig in enumerate(self.bode.figs):
+            wMin, wMax = fig.magAx.get_xlim()
+            # always start at the lowest default frequency so the phase is
+            # unwrapped from the same point
+            wMin = min(wMin, self.w[0])
+            for rider in ['Charlie', 'Jason', 'Luke']:
+                # the mean speed of an empty subset is nan
+                if np.isfinite(self.meanSpeed):
+                    mod = self.models.get(rider)
+                else:
+                    mod = None
+                if mod is None:
+                    # if the rider isn't there, don't plot the lines
+                    w = np.array([np.nan])
+                    mag = np.array([np.nan])
+                    phase = np.array([np.nan])
+                else:
+                    response = mod.adaptive_response(self.meanSpeed)
+                    w, H = response.evaluate(wMin, wMax)
+                    mag = 20. * np.log10(np.abs(H[:, i]))
+                    phase = np.rad2deg(np.unwrap(np.angle(H[:, i])))
+
+                    if phase[0] > 0.:
+                        phase = phase - 360.
+
+                line = self.systemNames.index(rider)
+                fig.magAx.lines[line].set_data(w, mag)
+                fig.phaseAx.lines[line].set_data(w, phase)
 
 class RootLociPlot(object):
     def __init__(self, models, expSpeed, eig, speed):
@@ -218,12 +406,17 @@ class RootLociPlot(object):
                 c=eigWithImag))
         self.imag = self.ax.plot(expSpeed, abs(np.imag(eig)), 'ob')
 
-        self.canvas = mpgtk.FigureCanvasGTK(self.fig)
-        self.canvas.show()
+        self.detail = LevelOfDetail(self.ax, self.real + self.imag)
+        self.update_plot(expSpeed, eig)
+
+        self.canvas = canvasFactory(self.fig)
 
+    @instrument.timed('plot.RootLociPlot.update_plot')
     def update_plot(self, speed, eig):
+        data = []
         for i, line in enumerate(self.real):
-            xy = np.vstack((speed, np.real(eig[:, i]))).T
-            line.set_offsets(xy)
+            eigWithImag = abs(np.imag(eig[:, i])) > 1e-10
+            data.append((speed, np.real(eig[:, i]), eigWithImag))
         for i, line in enumerate(self.imag):
-            line.set_data(speed, abs(np.imag(eig[:, i])))
+            data.append((speed, abs(np.imag(eig[:, i]))))
+        self.detail.set_data(data)
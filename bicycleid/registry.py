@@ -0,0 +1,162 @@
+"""Builds the first principles models of the riders concurrently.
+
+Constructing a Whipple model computes the bicycle and rider parameters from
+the raw measurements, which takes a few seconds for each rider. The registry
+submits every rider to a pool of worker processes and returns futures, so the
+models are built in parallel with each other and with loading the
+experimental data::
+
+    registry = ModelRegistry(source)
+    registry.submit_all(['Charlie', 'Jason', 'Luke'])
+    data = ExperimentalData(source=source)
+    models = registry.models()
+
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import instrument
+import model
+
+def _build(modelClass, rider, source):
+    """Constructs a model in a worker process."""
+    return modelClass(rider, source=source)
+
+class ModelRegistry(object):
+    """Constructs and holds a first principles model for each rider."""
+
+    def __init__(self, source=None, modelClass=model.Whipple, processes=None):
+        """
+        Parameters
+        ----------
+        source : sources.DataSource, optional
+            Where the bicycle parameters are loaded from, defaults to
+            sources.default_source() in the workers.
+        modelClass : class, optional
+            The FirstPrinciplesModel subclass, it is called with the rider and
+            the source.
+        processes : integer, optional
+            The number of worker processes, defaults to the number of cpus. If
+            1 the models are built in this process when they are submitted.
+
+        """
+
+        self.source = source
+        self.modelClass = modelClass
+        self.processes = processes
+
+        self.futures = {}
+        self._executor = None
+        # evaluates sweeps after their models are built
+        self._sweeps = ThreadPoolExecutor(1)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+        return self._executor
+
+    def submit(self, rider):
+        """Starts building the model of a rider, unless it has already been
+        submitted.
+
+        Parameters
+        ----------
+        rider : string
+            The rider name.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Its result is the model.
+
+        """
+
+        try:
+            return self.futures[rider]
+        except KeyError:
+            pass
+
+        if self.processes == 1:
+            future = Future()
+            try:
+                with instrument.timer('registry.build'):
+                    future.set_result(_build(self.modelClass, rider,
+                        self.source))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self._pool().submit(_build, self.modelClass, rider,
+                    self.source)
+
+        self.futures[rider] = future
+
+        return future
+
+    def submit_all(self, riders):
+        """Starts building the models of several riders and returns a
+        dictionary of their futures."""
+        return {rider: self.submit(rider) for rider in riders}
+
+    @instrument.timed('registry.models')
+    def models(self, riders=None, timeout=None):
+        """Waits for the models and returns them.
+
+        Parameters
+        ----------
+        riders : list, optional
+            The riders, defaults to all of the submitted riders. Riders that
+            haven't been submitted are submitted first.
+        timeout : float, optional
+            The seconds to wait for each model.
+
+        Returns
+        -------
+        models : dictionary
+            The model of each rider.
+
+        """
+
+        if riders is None:
+            riders = list(self.futures.keys())
+
+        futures = self.submit_all(riders)
+
+        return {rider: f.result(timeout) for rider, f in futures.items()}
+
+    def sweep(self, speeds, riders=None):
+        """Returns a future of the model matrices of several riders for an
+        array of speeds.
+
+        Parameters
+        ----------
+        speeds : array_like, shape(n,)
+            The speeds in meters per second.
+        riders : list, optional
+            The riders, defaults to all of the submitted riders.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Its result is a dictionary of FirstPrinciplesModel.matrices data
+            frames for each rider.
+
+        """
+
+        if riders is None:
+            riders = list(self.futures.keys())
+
+        self.submit_all(riders)
+
+        def evaluate():
+            return {rider: mod.matrices(speeds) for rider, mod in
+                    self.models(riders).items()}
+
+        return self._sweeps.submit(evaluate)
+
+    def shutdown(self, wait=True):
+        """Stops the worker processes, the built models are kept."""
+        if self._executor is not None:
+            self._executor.shutdown(wait)
+            self._executor = None
+        self._sweeps.shutdown(wait)
+        self._sweeps = ThreadPoolExecutor(1)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+"""A local data server that loads the experimental data and the rider models
+once and serves them to any number of GUI and analysis clients over a unix
+socket.
+
+The Bode magnitude and phase arrays are not sent over the socket, the server
+keeps them in a storage.BodeStore and the clients memory map the same files,
+so every client reads the single copy in the page cache. Put the data
+source's Bode store on a tmpfs, e.g. /dev/shm, to keep it in shared memory
+only.
+
+The server writes a random key next to the socket, readable only by its
+user, and clients must prove they have read it before any request is
+unpickled.
+
+Start the server with::
+
+    $ python server.py
+
+"""
+
+import os
+import time
+import threading
+from multiprocessing.connection import (Listener, Client,
+        AuthenticationError, answer_challenge, deliver_challenge)
+
+import numpy as np
+import pandas
+
+import data
+import instrument
+import ingest
+import model
+import registry
+import sources
+import storage
+
+def authkey_file(address):
+    """Returns the path to the key file of a server socket."""
+    return address + '.key'
+
+def write_authkey(address):
+    """Writes a new random key for a server socket, readable only by the
+    user, and returns it."""
+    fileName = authkey_file(address)
+    if os.path.exists(fileName):
+        os.remove(fileName)
+    # created with the permissions set, so the key is never readable by others
+    fd = os.open(fileName, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    authkey = os.urandom(32)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+    return authkey
+
+def read_authkey(address):
+    """Returns the key of a server socket."""
+    with open(authkey_file(address), 'rb') as f:
+        return f.read()
+
+class DataServer(object):
+    """Holds the experimental data and rider models and answers requests from
+    DataClient objects."""
+
+    riders = ['Charlie', 'Jason', 'Luke']
+    # seconds between checks for new system identification results
+    resultPollInterval = 5.0
+    # the model cache is emptied when it reaches this many results
+    maxCacheSize = 256
+    # the model methods clients can call
+    modelMethods = ['state_space', 'matrices', 'magnitude_phase']
+
+    def __init__(self, address=None, w=None, source=None):
+        """
+        Parameters
+        ----------
+        address : string, optional
+            The path to the unix socket, defaults to the source's.
+        w : ndarray, shape(n,), optional
+            The frequencies in radians/second for the Bode data.
+        source : sources.DataSource, optional
+            Where the data is loaded from, defaults to
+            sources.default_source().
+
+        """
+
+        if source is None:
+            source = sources.default_source()
+
+        if address is None:
+            self.address = source.dataServer
+        else:
+            self.address = address
+
+        if w is None:
+            w = np.logspace(-1, 2., num=200)
+
+        # guards the data and models, which are shared by the client threads
+        self.lock = threading.RLock()
+
+        print('Loading the first principles models...')
+        models = registry.ModelRegistry(source)
+        models.submit_all(self.riders)
+
+        print('Loading the experimental data...')
+        self.data = data.ExperimentalData(w=w, source=source,
+                bodeStore=storage.BodeStore(source.bodeStore, w,
+                    key=source.key()))
+        self.watcher = ingest.ResultWatcher(self.data)
+
+        self.models = models.models()
+        models.shutdown()
+
+        # model results keyed by the request arguments and parameters
+        self.modelCache = {}
+
+    def serve_forever(self):
+        """Accepts client connections until interrupted."""
+
+        directory = os.path.dirname(self.address)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # remove the socket left by a server that didn't shut down cleanly
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        self.authkey = write_authkey(self.address)
+        # the clients are authenticated in their own threads, so one that
+        # doesn't answer can't block the others
+        listener = Listener(self.address, family='AF_UNIX')
+        print('Serving on {}'.format(self.address))
+
+        poller = threading.Thread(target=self.poll_results)
+        poller.daemon = True
+        poller.start()
+
+        try:
+            while True:
+                connection = listener.accept()
+                thread = threading.Thread(target=self.handle,
+                        args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            listener.close()
+
+    def poll_results(self):
+        """Periodically adds new system identification results to the
+        data."""
+        while True:
+            try:
+                with self.lock:
+                    self.watcher.poll()
+            except Exception as e:
+                # keep polling, the watcher skips the files that failed
+                print('Polling for results failed: {!r}'.format(e))
+            time.sleep(self.resultPollInterval)
+
+    def handle(self, connection):
+        """Answers the requests from a single client until it
+        disconnects."""
+        try:
+            try:
+                deliver_challenge(connection, self.authkey)
+                answer_challenge(connection, self.authkey)
+            except (AuthenticationError, EOFError, IOError, OSError) as e:
+                print('Refused a client: {!r}'.format(e))
+                return
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except EOFError:
+                    break
+                try:
+                    with instrument.timer('server.' + method), self.lock:
+                        result = getattr(self, 'serve_' + method)(*args,
+                                **kwargs)
+                except Exception as e:
+                    connection.send(('error', '{}: {}'.format(
+                        e.__class__.__name__, e)))
+                else:
+                    connection.send(('ok', result))
+        finally:
+            connection.close()
+
+    ## Requests ##
+
+    def serve_info(self):
+        """Returns the number of runs, the frequencies and the Bode store
+        directory."""
+        return (len(self.data.dataFrame), self.data.w,
+                self.data.bodeStore.directory)
+
+    def serve_data_frame(self, start=0):
+        """Returns the rows of the data frame from start onwards."""
+        return self.data.dataFrame.iloc[start:]
+
+    def serve_subset(self, kwargs):
+        return self.data.subset(**kwargs)
+
+    def serve_subset_bode(self, kwargs):
+        return self.data.subset_bode(**kwargs)
+
+    def serve_subset_eig(self, kwargs):
+        return self.data.subset_eig(**kwargs)
+
+    def serve_eig(self):
+        return self.data.eig
+
+    def serve_model(self, rider):
+        """Returns the bicycle and default parameters for a rider model."""
+        mod = self.models[rider]
+        return mod.bicycle, mod.defaultParameters
+
+    def serve_model_call(self, rider, method, parameters, *args):
+        """Returns the result of calling a model method with the supplied
+        parameters."""
+
+        if method not in self.modelMethods:
+            raise ValueError('{} is not a model method that can be '
+                    'called.'.format(method))
+
+        key = (rider, method, tuple(sorted(parameters.items())),
+                tuple(np.asarray(a).tobytes() for a in args))
+
+        try:
+            result = self.modelCache[key]
+        except KeyError:
+            instrument.count('server.modelCache.miss')
+            mod = self.models[rider]
+            mod.set_parameters(parameters)
+            try:
+                result = getattr(mod, method)(*args)
+            finally:
+                mod.set_default_parameters()
+            if len(self.modelCache) >= self.maxCacheSize:
+                self.modelCache.clear()
+            self.modelCache[key] = result
+        else:
+            instrument.count('server.modelCache.hit')
+
+        return result
+
+class DataClient(object):
+    """Provides the ExperimentalData interface for the data held by a
+    DataServer."""
+
+    def __init__(self, address=None):
+
+        if address is None:
+            address = sources.default_source().dataServer
+
+        self.connection = Client(address, family='AF_UNIX',
+                authkey=read_authkey(address))
+        self.lock = threading.Lock()
+
+        self._dataFrame = None
+        numRuns, self.w, self.bodeDirectory = self.request('info')
+
+    def request(self, method, *args, **kwargs):
+        """Returns the server's result for a request."""
+        with self.lock:
+            self.connection.send((method, args, kwargs))
+            status, result = self.connection.recv()
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def dataFrame(self):
+        """The full data frame, only new rows are fetched from the
+        server."""
+        numRuns = self.request('info')[0]
+        if self._dataFrame is None:
+            self._dataFrame = self.request('data_frame')
+        elif numRuns > len(self._dataFrame):
+            self._dataFrame = pandas.concat([self._dataFrame,
+                self.request('data_frame', len(self._dataFrame))],
+                ignore_index=True)
+        return self._dataFrame
+
+    @property
+    def magnitudes(self):
+        """The memory mapped magnitudes shared with the server."""
+        store = storage.BodeStore.open(self.bodeDirectory)
+        # the store can hold rows after the server's runs
+        return store.magnitudes[:self.request('info')[0]]
+
+    @property
+    def phases(self):
+        """The memory mapped phases shared with the server."""
+        store = storage.BodeStore.open(self.bodeDirectory)
+        # the store can hold rows after the server's runs
+        return store.phases[:self.request('info')[0]]
+
+    @property
+    def eig(self):
+        return self.request('eig')
+
+    def subset(self, **kwargs):
+        return self.request('subset', kwargs)
+
+    def subset_bode(self, **kwargs):
+        return self.request('subset_bode', kwargs)
+
+    def subset_eig(self, **kwargs):
+        return self.request('subset_eig', kwargs)
+
+class RemoteWhipple(model.FirstPrinciplesModel):
+    """A Whipple model for a rider that is evaluated by a DataServer. The
+    parameters are kept locally, so changing them doesn't affect other
+    clients."""
+
+    def __init__(self, client, rider):
+
+        if rider not in self.possibleRiders:
+            raise ValueError('{} is not a valid rider.'.format(rider))
+
+        self.client = client
+        self.rider = rider
+        self.bicycle, self.defaultParameters = client.request('model', rider)
+        self.parameters = {}
+        self.set_default_parameters()
+
+    def changed_parameters(self):
+        """Returns the parameters that differ from the defaults."""
+        return {k: v for k, v in self.parameters.items() if v !=
+                self.defaultParameters[k]}
+
+    def state_space(self, speed):
+        return self.client.request('model_call', self.rider, 'state_space',
+                self.changed_parameters(), speed)
+
+    def matrices(self, speedRange):
+        return self.client.request('model_call', self.rider, 'matrices',
+                self.changed_parameters(), speedRange)
+
+    def magnitude_phase(self, speed, w):
+        return self.client.request('model_call', self.rider,
+                'magnitude_phase', self.changed_parameters(), speed, w)
+
+class ServerWatcher(object):
+    """Provides the ingest.ResultWatcher interface for a client, notifying
+    the callbacks of the runs the server has added."""
+
+    def __init__(self, client):
+        self.client = client
+        self.numRuns = client.request('info')[0]
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def poll(self):
+        new = []
+        numRuns = self.client.request('info')[0]
+        if numRuns > self.numRuns:
+            new.append(self.client.request('data_frame', self.numRuns))
+            self.numRuns = numRuns
+        for runs in new:
+            for callback in self.callbacks:
+                callback(runs)
+        return new
+
+if __name__ == '__main__':
+    DataServer().serve_forever()
@@ -0,0 +1,319 @@
+"""Selects where the system identification results, the run table and the
+bicycle parameters are loaded from.
+
+The defaults are the paths in config.py. They can be overridden by a
+configuration file, which is read from the path in the BICYCLEID_CONFIG
+environment variable or ~/.bicycleid/config.ini, e.g.::
+
+    [paths]
+    systemID = /scratch/bicycle/whipple-structured-results.mat
+    database = /scratch/bicycle/InstrumentedBicycleData.h5
+    parameters = /scratch/bicycle/BicycleParameters/data
+
+then by environment variables, e.g. BICYCLEID_SYSTEM_ID, and finally in code
+by passing a DataSource, which can also hold in-memory data, to the classes
+that load data or by calling set_default_source.
+
+"""
+
+import os
+import hashlib
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import SafeConfigParser as ConfigParser
+
+import numpy as np
+import pandas
+from scipy.io import loadmat
+
+import config
+
+def content_hash(mat):
+    """Returns a hash of the run files and the state and input matrices of
+    system identification results.
+
+    Parameters
+    ----------
+    mat : dictionary
+        The variables of a system identification results file.
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update('\n'.join(str(f) for f in
+        np.atleast_1d(mat['matFiles'])).encode())
+
+    for name in ['stateMatrices', 'inputMatrices']:
+        matrices = np.asarray(mat[name])
+        # cell arrays are an object array of matrices
+        if matrices.dtype == object:
+            matrices = [np.asarray(m, dtype=float) for m in matrices.ravel()]
+        else:
+            matrices = [matrices.astype(float)]
+        for m in matrices:
+            digest.update(np.ascontiguousarray(m).tobytes())
+
+    return digest.hexdigest()
+
+class DataSource(object):
+    """The locations of, or the data itself, for the system identification
+    results, run table and bicycle parameters."""
+
+    # the source attributes, their environment variables and config.py
+    # defaults
+    settings = [('systemID', 'BICYCLEID_SYSTEM_ID', 'PATH_TO_SYSTEM_ID_DATA'),
+                ('results', 'BICYCLEID_RESULTS', 'PATH_TO_SYSTEM_ID_RESULTS'),
+                ('database', 'BICYCLEID_DATABASE', 'PATH_TO_DATABASE'),
+                ('pathToH5', 'BICYCLEID_H5', 'PATH_TO_H5'),
+                ('pathToCorruption', 'BICYCLEID_CORRUPT', 'PATH_TO_CORRUPT'),
+                ('parameters', 'BICYCLEID_PARAMETERS', 'PATH_TO_PARAMETERS'),
+                ('bodeStore', 'BICYCLEID_BODE_STORE', 'PATH_TO_BODE_STORE'),
+                ('dataServer', 'BICYCLEID_DATA_SERVER', 'PATH_TO_DATA_SERVER')]
+
+    tableCols = ['Rider', 'Maneuver', 'Environment', 'Speed']
+    signalNames = ['RollAngle', 'SteerAngle', 'RollRate', 'SteerRate',
+            'SteerTorque', 'PullForce']
+
+    def __init__(self, systemID=None, results=None, runTable=None,
+            database=None, pathToH5=None, pathToCorruption=None,
+            parameters=None, bodeStore=None, dataServer=None, signals=None):
+        """Any argument that isn't supplied is None and the corresponding data
+        is unavailable, use from_config for a source with defaults.
+
+        Parameters
+        ----------
+        systemID : string or dictionary
+            The path to the system identification results .mat file or a
+            dictionary with the same variables.
+        results : string
+            The directory of new result files to ingest.
+        runTable : pandas.DataFrame
+            A table indexed by the integer run id with the Rider, Maneuver,
+            Environment and Speed columns. If None the run table is read
+            from the database.
+        database : string
+            The path to the bicycledataprocessor HDF5 database.
+        pathToH5 : string
+            The directory of the raw run HDF5 files.
+        pathToCorruption : string
+            The path to the data corruption csv file.
+        parameters : string or dictionary
+            The BicycleParameters data directory or a dictionary mapping rider
+            names to bicycleparameters.Bicycle like objects that have the
+            rider added.
+        bodeStore : string
+            The directory of the memory mapped Bode data.
+        dataServer : string
+            The path to the data server's unix socket.
+        signals : dictionary
+            A dictionary mapping integer run ids to dictionaries of measured
+            signals, see run_signals. If None the signals are read from the
+            database.
+
+        """
+
+        self.systemID = systemID
+        self.results = results
+        self.runTable = runTable
+        self.database = database
+        self.pathToH5 = pathToH5
+        self.pathToCorruption = pathToCorruption
+        self.parameters = parameters
+        self.bodeStore = bodeStore
+        self.dataServer = dataServer
+        self.signals = signals
+
+    @classmethod
+    def from_config(cls, fileName=None, **kwargs):
+        """Returns a source with the config.py defaults overridden by a
+        configuration file, the environment variables and then the keyword
+        arguments.
+
+        Parameters
+        ----------
+        fileName : string, optional
+            The configuration file, defaults to the BICYCLEID_CONFIG
+            environment variable or ~/.bicycleid/config.ini if it exists.
+        kwargs
+            Any of the DataSource arguments.
+
+        """
+
+        if fileName is None:
+            fileName = os.environ.get('BICYCLEID_CONFIG',
+                os.path.join(os.path.expanduser('~'), '.bicycleid',
+                    'config.ini'))
+
+        parser = ConfigParser()
+        parser.read(fileName)
+
+        values = {}
+        for attr, variable, default in cls.settings:
+            values[attr] = getattr(config, default)
+            if parser.has_option('paths', attr):
+                values[attr] = parser.get('paths', attr)
+            if variable in os.environ:
+                values[attr] = os.environ[variable]
+
+        values.update(kwargs)
+
+        return cls(**values)
+
+    def copy(self, **kwargs):
+        """Returns a copy of the source with some attributes replaced."""
+        values = dict(self.__dict__)
+        values.update(kwargs)
+        return self.__class__(**values)
+
+    def key(self):
+        """Returns a string that identifies the version of the system
+        identification results, used to invalidate cached data. The key of
+        in-memory results is a hash of their run files and matrices."""
+        if isinstance(self.systemID, dict):
+            return 'memory:{}'.format(content_hash(self.systemID))
+        else:
+            return '{}:{}'.format(self.systemID,
+                    os.path.getmtime(self.systemID))
+
+    def load_mat(self, systemID=None):
+        """Returns the variables of a system identification results file.
+
+        Parameters
+        ----------
+        systemID : string or dictionary, optional
+            A .mat file or its contents, defaults to self.systemID.
+
+        """
+        if systemID is None:
+            systemID = self.systemID
+        if isinstance(systemID, dict):
+            return systemID
+        else:
+            return loadmat(systemID, squeeze_me=True)
+
+    def run_table(self, runIDs):
+        """Returns the Rider, Maneuver, Environment and Speed of runs.
+
+        Parameters
+        ----------
+        runIDs : list
+            The integer run ids.
+
+        Returns
+        -------
+        table : pandas.DataFrame
+            A row for each run id, in order, with the environments as they
+            are labeled in the database. The rows of runs that aren't in the
+            table are null.
+
+        """
+
+        if self.runTable is not None:
+            return self.runTable.reindex(list(runIDs))[self.tableCols]
+
+        # the database is only needed when the run table isn't supplied
+        import bicycledataprocessor as bdp
+        from bicycledataprocessor.database import get_row_num
+
+        dataset = bdp.DataSet(fileName=self.database, pathToH5=self.pathToH5,
+                pathToCorruption=self.pathToCorruption)
+        dataset.open()
+
+        table = dataset.database.root.runTable
+
+        d = {col: [] for col in self.tableCols}
+
+        for r in runIDs:
+            try:
+                i = get_row_num(run_id_string(r), table)
+            except (IndexError, ValueError):
+                i = None
+            for col in self.tableCols:
+                d[col].append(None if i is None else table[i][col])
+
+        dataset.close()
+
+        return pandas.DataFrame(d, index=list(runIDs))
+
+    def run_signals(self, runID):
+        """Returns the measured signals of a run.
+
+        Parameters
+        ----------
+        runID : integer
+            The run id.
+
+        Returns
+        -------
+        signals : dictionary
+            The time and the RollAngle, SteerAngle, RollRate, SteerRate,
+            SteerTorque and PullForce task signals, each an ndarray of the
+            same length.
+
+        """
+
+        if self.signals is not None:
+            return self.signals[runID]
+
+        import bicycledataprocessor as bdp
+
+        dataset = bdp.DataSet(fileName=self.database, pathToH5=self.pathToH5,
+                pathToCorruption=self.pathToCorruption)
+        dataset.open()
+
+        try:
+            # don't write the processed signals back to the shared database
+            run = bdp.Run(run_id_string(runID), dataset, store=False)
+            signals = {name: np.asarray(run.taskSignals[name]) for name in
+                    self.signalNames}
+            signals['time'] = np.asarray(
+                    run.taskSignals[self.signalNames[0]].time())
+        finally:
+            dataset.close()
+
+        return signals
+
+    def bicycle(self, rider, bicycleName):
+        """Returns a bicycleparameters.Bicycle with the rider added.
+
+        Parameters
+        ----------
+        rider : string
+            The rider name.
+        bicycleName : string
+            The bicycle name in the parameter directory.
+
+        """
+
+        if isinstance(self.parameters, dict):
+            return self.parameters[rider]
+
+        import bicycleparameters as bp
+
+        bicycle = bp.Bicycle(bicycleName, pathToData=self.parameters,
+                forceRawCalc=True)
+        bicycle.add_rider(rider)
+
+        return bicycle
+
+def run_id_string(runID):
+    """Returns the zero padded run id used by the database, e.g. '00105'."""
+    return '{:0>5}'.format(int(runID))
+
+_defaultSource = None
+
+def default_source():
+    """Returns the source used when none is supplied, DataSource.from_config()
+    unless set_default_source has been called."""
+    global _defaultSource
+    if _defaultSource is None:
+        _defaultSource = DataSource.from_config()
+    return _defaultSource
+
+def set_default_source(source):
+    """Sets the source used when none is supplied, e.g. in a worker process
+    or a benchmark."""
+    global _defaultSource
+    _defaultSource = source
@@ -0,0 +1,174 @@
+import os
+import json
+
+import numpy as np
+
+class BodeStore(object):
+    """Stores the magnitude and phase arrays of the identified runs in raw
+    binary files that are memory mapped, so that many processes can share them
+    and subsets only load the rows they touch.
+
+    The arrays have shape (runs, frequencies, outputs) and the rows are
+    ordered as they were appended.
+
+    """
+
+    metaFileName = 'bode.json'
+    arrayNames = ['magnitudes', 'phases']
+
+    def __init__(self, directory, w, numOutputs=2, dtype=np.float32,
+            key=None):
+        """Opens the store in the directory, clearing it if it was written
+        for a different frequency vector, data type or key.
+
+        Parameters
+        ----------
+        directory : string
+            The directory for the store files, created if needed.
+        w : ndarray, shape(n,)
+            The frequencies in radians/second.
+        numOutputs : integer, optional
+            The number of transfer functions.
+        dtype : numpy.dtype, optional
+            The data type on disk, float32 halves the size of float64.
+        key : string, optional
+            Identifies the source of the data, the store is cleared if it
+            doesn't match the stored key.
+
+        """
+
+        self.directory = directory
+        self.w = np.asarray(w, dtype=float)
+        self.numOutputs = numOutputs
+        self.dtype = np.dtype(dtype)
+        self.key = key
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        meta = self._read_meta()
+
+        if (meta is None or meta['key'] != self.key or
+                meta['dtype'] != self.dtype.str or
+                meta['numOutputs'] != self.numOutputs or
+                len(meta['w']) != len(self.w) or
+                not np.allclose(meta['w'], self.w)):
+            self.runIDs = []
+            self.clear()
+        else:
+            self.runIDs = meta['runIDs']
+            self._map()
+
+    @classmethod
+    def open(cls, directory):
+        """Returns the store in the directory as it was last written, without
+        checking or clearing it. Use this to read a store that another process
+        writes to."""
+
+        store = cls.__new__(cls)
+        store.directory = directory
+        meta = store._read_meta()
+        if meta is None:
+            raise IOError('There is no Bode store in {}.'.format(directory))
+        store.w = np.array(meta['w'])
+        store.numOutputs = meta['numOutputs']
+        store.dtype = np.dtype(meta['dtype'])
+        store.key = meta['key']
+        store.runIDs = meta['runIDs']
+        store._map()
+
+        return store
+
+    def __len__(self):
+        return len(self.runIDs)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.dat')
+
+    def _row_bytes(self):
+        return len(self.w) * self.numOutputs * self.dtype.itemsize
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.directory, self.metaFileName)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_meta(self):
+        meta = {'key': self.key,
+                'dtype': self.dtype.str,
+                'numOutputs': self.numOutputs,
+                'w': self.w.tolist(),
+                'runIDs': self.runIDs}
+        path = os.path.join(self.directory, self.metaFileName)
+        # write then rename so readers never see a partial file
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.rename(path + '.tmp', path)
+
+    def _map(self):
+        """Memory maps the arrays for the rows listed in the meta data."""
+        shape = (len(self.runIDs), len(self.w), self.numOutputs)
+        for name in self.arrayNames:
+            if shape[0] == 0:
+                array = np.zeros(shape, dtype=self.dtype)
+            else:
+                array = np.memmap(self._path(name), dtype=self.dtype,
+                        mode='r', shape=shape)
+            setattr(self, name, array)
+
+    def clear(self):
+        """Removes all of the runs from the store."""
+        self.truncate(0)
+
+    def truncate(self, numRuns):
+        """Removes the runs after the first numRuns from the store.
+
+        The kept rows are copied to new files that replace the old ones, so
+        other processes that still map the old files can keep reading them
+        instead of faulting on a file that shrank under them.
+
+        """
+
+        numRuns = min(numRuns, len(self.runIDs))
+
+        for name in self.arrayNames:
+            path = self._path(name)
+            with open(path + '.tmp', 'wb') as f:
+                np.ascontiguousarray(getattr(self, name,
+                    np.zeros(0))[:numRuns], dtype=self.dtype).tofile(f)
+            os.rename(path + '.tmp', path)
+
+        self.runIDs = self.runIDs[:numRuns]
+        self._write_meta()
+        self._map()
+
+    def append(self, runIDs, magnitudes, phases):
+        """Adds runs to the end of the store.
+
+        Parameters
+        ----------
+        runIDs : list
+            The run ids of the rows.
+        magnitudes : ndarray, shape(n, len(w), numOutputs)
+        phases : ndarray, shape(n, len(w), numOutputs)
+
+        """
+
+        runIDs = list(runIDs)
+        offset = len(self.runIDs) * self._row_bytes()
+
+        for name, array in zip(self.arrayNames, [magnitudes, phases]):
+            array = np.ascontiguousarray(array, dtype=self.dtype)
+            if array.shape != (len(runIDs), len(self.w), self.numOutputs):
+                raise ValueError('{} has shape {}.'.format(name, array.shape))
+            with open(self._path(name), 'r+b') as f:
+                # overwrite anything left by an interrupted append
+                f.seek(offset)
+                array.tofile(f)
+                f.truncate()
+
+        self.runIDs = self.runIDs + runIDs
+        self._write_meta()
+        self._map()
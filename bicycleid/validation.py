@@ -0,0 +1,205 @@
+"""Scores the identified and first principles models of each run against the
+run's measured signals.
+
+Each run's steer torque and lateral force are applied to the models, starting
+from the measured initial state, and the simulated roll angle, steer angle,
+roll rate and steer rate are compared to the measured ones with the same fit
+percentage as the system identification results,
+
+    100 * (1 - ||y - yhat|| / ||y - mean(y)||)
+
+The runs are split into chunks that are scored by a pool of worker processes.
+Each worker loads one run's signals at a time, so the memory used is bounded by
+the longest run, not the number of runs.
+
+"""
+
+import multiprocessing
+
+import numpy as np
+import pandas
+
+import instrument
+import model
+
+states = ['Phi', 'Delta', 'PhiDot', 'DeltaDot']
+stateSignals = ['RollAngle', 'SteerAngle', 'RollRate', 'SteerRate']
+inputSignals = ['SteerTorque', 'PullForce']
+
+def simulate(A, B, u, dt, x0):
+    """Returns the response of a continuous system to a sampled input held
+    constant between samples (zero order hold).
+
+    The system is simulated in its modal form, so each mode is a first order
+    recursion that is evaluated by scipy.signal.lfilter instead of a Python
+    loop over the samples.
+
+    Parameters
+    ----------
+    A : ndarray, shape(n, n)
+        The state matrix.
+    B : ndarray, shape(n, m)
+        The input matrix.
+    u : ndarray, shape(N, m)
+        The inputs at each sample.
+    dt : float
+        The sample period in seconds.
+    x0 : ndarray, shape(n,)
+        The initial state.
+
+    Returns
+    -------
+    x : ndarray, shape(N, n)
+        The state at each sample.
+
+    """
+
+    from scipy.signal import lfilter
+
+    poles, V = np.linalg.eig(A)
+    W = np.linalg.inv(V)
+
+    a = np.exp(poles * dt)
+    # the zero order hold gain of each mode, (a - 1) / p tends to dt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hold = np.where(np.abs(poles) > 1e-12, (a - 1.) / poles, dt)
+    modalInput = np.dot(u, (hold[:, np.newaxis] * np.dot(W, B)).T)
+    z0 = np.dot(W, x0)
+
+    z = np.zeros((u.shape[0], len(poles)), dtype=complex)
+    with np.errstate(over='ignore', invalid='ignore'):
+        for k in range(len(poles)):
+            # z[n] = a z[n - 1] + b u[n - 1], z[0] = z0
+            z[:, k] = lfilter([0., 1.], [1., -a[k]], modalInput[:, k],
+                    zi=[z0[k]])[0]
+        return np.real(np.dot(z, V.T))
+
+def fit(measured, simulated):
+    """Returns the fit percentage of each column of a simulation."""
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        error = np.linalg.norm(measured - simulated, axis=0)
+        spread = np.linalg.norm(measured - measured.mean(axis=0), axis=0)
+        return 100. * (1. - error / spread)
+
+# the rider models of a worker process, built when first needed
+_models = {}
+_source = None
+
+def _initialize_worker(source):
+    global _source
+    _source = source
+    _models.clear()
+
+def _whipple(rider):
+    try:
+        return _models[rider]
+    except KeyError:
+        _models[rider] = model.Whipple(rider, source=_source)
+        return _models[rider]
+
+def score_run(runID, rider, speed, A, B, source):
+    """Returns the fits of the identified and Whipple models for a run.
+
+    Parameters
+    ----------
+    runID : integer
+        The run id.
+    rider : string
+        The rider of the run.
+    speed : float
+        The mean speed of the run in meters per second.
+    A : ndarray, shape(4, 4)
+        The identified state matrix.
+    B : ndarray, shape(4, 2)
+        The identified input matrix.
+    source : sources.DataSource
+        Where the signals and bicycle parameters are loaded from.
+
+    Returns
+    -------
+    row : dictionary
+        The fit of each state and the mean fit for both models, e.g.
+        IdentifiedPhiFit and WhippleMeanFit.
+
+    """
+
+    with instrument.timer('validation.signals'):
+        signals = source.run_signals(runID)
+
+    time = np.asarray(signals['time'])
+    dt = time[1] - time[0]
+    y = np.column_stack([signals[name] for name in stateSignals])
+    u = np.column_stack([signals[name] for name in inputSignals])
+
+    systems = [('Identified', A, B)]
+    if rider in model.FirstPrinciplesModel.possibleRiders:
+        systems.append(('Whipple',) + _whipple(rider).state_space(speed))
+
+    row = {'RunID': runID}
+    with instrument.timer('validation.simulate'):
+        for name, sysA, sysB in systems:
+            fits = fit(y, simulate(sysA, sysB, u, dt, y[0]))
+            for state, f in zip(states, fits):
+                row[name + state + 'Fit'] = f
+            row[name + 'MeanFit'] = np.mean(fits)
+
+    return row
+
+def _score_chunk(runs):
+    """Scores a list of runs in a worker process."""
+    return [score_run(*(run + (_source,))) for run in runs]
+
+@instrument.timed('validation.validate')
+def validate(data, runIDs=None, processes=None, chunkSize=16):
+    """Scores the identified and Whipple models of runs against their
+    measured signals in parallel.
+
+    Parameters
+    ----------
+    data : data.ExperimentalData
+        The identified runs.
+    runIDs : list, optional
+        The runs to score, defaults to all of the runs in the data.
+    processes : integer, optional
+        The number of worker processes, defaults to the number of cpus. If 1
+        the runs are scored in this process.
+    chunkSize : integer, optional
+        The number of runs sent to a worker at a time.
+
+    Returns
+    -------
+    fits : pandas.DataFrame
+        The fits of each run indexed by run id, see score_run.
+
+    """
+
+    df = data.dataFrame
+    if runIDs is not None:
+        df = df[df['RunID'].isin(runIDs)]
+
+    indices = np.nonzero(data.dataFrame['RunID'].isin(df['RunID']).values)[0]
+
+    runs = [(df['RunID'].iloc[k], df['Rider'].iloc[k],
+        float(df['ActualSpeed'].iloc[k]), data.stateMatrices[i],
+        data.inputMatrices[i]) for k, i in enumerate(indices)]
+    chunks = [runs[i:i + chunkSize] for i in range(0, len(runs), chunkSize)]
+
+    if processes == 1:
+        _initialize_worker(data.source)
+        rows = [row for chunk in chunks for row in _score_chunk(chunk)]
+    else:
+        # each worker only handles a limited number of chunks, so memory
+        # leaked by the hdf5 readers is returned
+        pool = multiprocessing.Pool(processes, _initialize_worker,
+                (data.source,), maxtasksperchild=16)
+        try:
+            rows = [row for result in pool.imap(_score_chunk, chunks) for row
+                    in result]
+        finally:
+            pool.close()
+            pool.join()
+
+    columns = ['RunID'] + [m + s + 'Fit' for m in ['Identified', 'Whipple'] for
+            s in states + ['Mean']]
+
+    return pandas.DataFrame(rows, columns=columns).set_index('RunID')
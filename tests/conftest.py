@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# the modules import each other by name, e.g. import data, and the synthetic
+# data is shared with the benchmarks
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+sys.path.insert(0, os.path.join(root, 'bicycleid'))
+
+import fixtures
+import sources
+
+@pytest.fixture
+def source():
+    """A data source with 500 synthetic runs and a model for each rider."""
+    mat, runTable = fixtures.system_id_results(500)
+    return sources.DataSource(systemID=mat, runTable=runTable,
+            parameters={rider: fixtures.SyntheticBicycle(
+                fixtures.parameter_set(i)) for i, rider in
+                enumerate(fixtures.riders)})
@@ -0,0 +1,40 @@
+import numpy as np
+
+import frequency
+import model
+
+def whipple(source):
+    return model.Whipple('Jason', source=source)
+
+def test_modal_form_matches_state_space(source):
+    mod = whipple(source)
+    A, B = mod.state_space(4.0)
+    B = B[:, :1]
+    C = np.eye(4)[:2]
+    w = np.logspace(-1, 2, 50)
+
+    H = frequency.modal_response(*frequency.modal_form(A, B, C), w=w)
+
+    expected = np.array([C.dot(np.linalg.solve(1j * x * np.eye(4) - A, B))
+        for x in w])
+    np.testing.assert_allclose(H, expected)
+
+def test_modal_form_of_nan_systems_is_nan(source):
+    A, B = whipple(source).state_spaces(np.array([2.0, 4.0]))
+    A[1, 0, 0] = np.nan
+
+    poles, residues = frequency.modal_form(A, B[:, :, :1], np.eye(4)[:2])
+
+    assert np.isfinite(poles[0]).all() and np.isfinite(residues[0]).all()
+    assert np.isnan(poles[1]).all() and np.isnan(residues[1]).all()
+
+def test_magnitude_phase_at_nan_speed_is_nan(source):
+    # the mean speed of an empty subset is nan
+    mod = whipple(source)
+    w = np.logspace(-1, 2, 20)
+
+    mag, phase = mod.magnitude_phase(np.nan, w)
+    assert mag.shape == (20, 2) and np.isnan(mag).all()
+
+    w, H = mod.adaptive_response(np.nan).evaluate(0.1, 100.)
+    assert np.isnan(H).all()
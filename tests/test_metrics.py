@@ -0,0 +1,16 @@
+import numpy as np
+
+import data
+import metrics
+import model
+
+def test_runs_without_a_speed_have_nan_metrics(source):
+    d = data.ExperimentalData(source=source, w=np.logspace(-1, 1, 20))
+    d.dataFrame.loc[[3, 7], 'ActualSpeed'] = np.nan
+    models = {rider: model.Whipple(rider, source=source) for rider in
+            ['Charlie', 'Jason', 'Luke']}
+
+    scores = metrics.compare(d, models)
+
+    assert scores.loc[[3, 7], 'MeanMagnitudeError'].isnull().all()
+    assert scores['MeanMagnitudeError'].notnull().sum() == len(d.dataFrame) - 2
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import data
+import model
+import plot
+
+@pytest.fixture(autouse=True)
+def agg_canvas(monkeypatch):
+    monkeypatch.setattr(plot, 'canvasFactory', FigureCanvasAgg)
+
+def test_bode_plot_of_an_empty_subset(source):
+    w = np.logspace(-1, 1, 20)
+    d = data.ExperimentalData(source=source, w=w)
+    models = {rider: model.Whipple(rider, source=source) for rider in
+            ['Charlie', 'Jason', 'Luke']}
+    bodePlot = plot.BodePlot(w)
+
+    bodePlot.update_graph(d.subset_bode(Speed=['2.0']), models)
+    line = bodePlot.bode.figs[0].magAx.lines[4]
+    assert np.isfinite(line.get_ydata()).all()
+
+    # the mean speed of no runs is nan
+    bodePlot.update_graph(d.subset_bode(Rider=[], Speed=['2.0']), models)
+    assert np.isnan(line.get_ydata()).all()
+    for canvas in bodePlot.canvases:
+        canvas.draw()
@@ -0,0 +1,54 @@
+import os
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import server
+
+@pytest.fixture
+def address(source, tmp_path):
+    """Starts a data server for the synthetic source and returns its
+    socket."""
+    address = str(tmp_path / 'server' / 'data.sock')
+    source = source.copy(results=str(tmp_path / 'results'),
+            bodeStore=str(tmp_path / 'bode'), dataServer=address)
+    dataServer = server.DataServer(w=np.logspace(-1, 1, 20), source=source)
+    thread = threading.Thread(target=dataServer.serve_forever)
+    thread.daemon = True
+    thread.start()
+    for i in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.05)
+    return address
+
+def test_key_file_is_private(address):
+    mode = os.stat(server.authkey_file(address)).st_mode
+    assert stat.S_IMODE(mode) == 0o600
+
+def test_client_with_the_key(address):
+    client = server.DataClient(address)
+    assert len(client.dataFrame) == 500
+    A, B = server.RemoteWhipple(client, 'Jason').state_space(4.0)
+    assert A.shape == (4, 4)
+    client.close()
+
+def test_client_without_the_key_is_refused(address):
+    with pytest.raises(server.AuthenticationError):
+        server.Client(address, family='AF_UNIX', authkey=b'wrong')
+    # the server keeps serving the other clients
+    client = server.DataClient(address)
+    assert client.request('info')[0] == 500
+    client.close()
+
+def test_only_model_methods_can_be_called(address):
+    client = server.DataClient(address)
+    with pytest.raises(RuntimeError):
+        client.request('model_call', 'Jason', 'set_parameters', {},
+                {'g': 0.})
+    with pytest.raises(RuntimeError):
+        client.request('model_call', 'Jason', '__init__', {}, 'Luke')
+    client.close()
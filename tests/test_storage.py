@@ -0,0 +1,36 @@
+import numpy as np
+
+import data
+import fixtures
+import sources
+import storage
+
+def load(source, directory, w):
+    store = storage.BodeStore(directory, w, key=source.key())
+    return data.ExperimentalData(source=source, w=w, bodeStore=store)
+
+def test_in_memory_sources_do_not_share_bode_data(tmp_path):
+    w = np.logspace(-1, 1, 20)
+    directory = str(tmp_path / 'bode')
+    mat, runTable = fixtures.system_id_results(50)
+    first = sources.DataSource(systemID=mat, runTable=runTable)
+    mat, runTable = fixtures.system_id_results(50, seed=1)
+    second = sources.DataSource(systemID=mat, runTable=runTable)
+
+    load(first, directory, w)
+    # the same run ids with different results
+    d = load(second, directory, w)
+
+    expected = data.ExperimentalData(source=second, w=w)
+    np.testing.assert_allclose(d.magnitudes, expected.magnitudes)
+    np.testing.assert_allclose(d.phases, expected.phases)
+
+def test_key_of_in_memory_results_depends_on_the_content():
+    mat, runTable = fixtures.system_id_results(50)
+    copy = {k: np.array(v, copy=True) for k, v in mat.items()}
+    assert (sources.DataSource(systemID=mat).key() ==
+            sources.DataSource(systemID=copy).key())
+
+    copy['stateMatrices'][3, 2, 0] += 1.
+    assert (sources.DataSource(systemID=mat).key() !=
+            sources.DataSource(systemID=copy).key())
@@ -0,0 +1,70 @@
+"""The summaries and the export filters select the same runs as
+ExperimentalData.subset."""
+
+import numpy as np
+import pytest
+
+import aggregate
+import data
+import export
+
+subsets = [
+    {},
+    {'MeanFit': 42.},
+    {'MeanFit': 40.},
+    {'Rider': ['Jason'], 'MeanFit': 13.7},
+    {'Speed': ['2.0', '4.0'], 'MeanFit': 42.},
+    {'Speed': ['4.92']},
+    {'Rider': ['Charlie', 'Luke'], 'Maneuver': ['Balance'],
+        'Environment': ['Horse Treadmill']},
+    {'Environment': ['Pavilion'], 'Speed': ['1.4', '9.0']},
+    ]
+
+@pytest.fixture
+def experimental(source):
+    d = data.ExperimentalData(source=source, w=np.logspace(-1, 1, 20))
+    frame = d.dataFrame
+    frame['Speed'] = frame['Speed'].astype(float)
+    # a run between the bins and runs with missing values
+    frame.loc[7, 'Speed'] = 3.3
+    frame.loc[[3, 10], 'Speed'] = np.nan
+    frame.loc[[5, 6], 'MeanFit'] = np.nan
+    frame.loc[[11, 12], 'a31'] = np.nan
+    return d
+
+@pytest.mark.parametrize('kwargs', subsets)
+def test_summary_matches_subset(experimental, kwargs):
+    frame = experimental.dataFrame
+    half = len(frame) // 2
+    summary = aggregate.CoefficientSummary(frame.iloc[:half])
+    summary.update(frame.iloc[half:])
+
+    expected = experimental.subset(**kwargs).groupby('Speed', observed=True,
+            dropna=False)['a31'].agg(['count', 'mean', 'std'])
+    summarized = summary.summarize(groupBy='Speed', **kwargs)['a31']
+
+    np.testing.assert_array_equal(summarized.index, expected.index)
+    for stat in ['count', 'mean', 'std']:
+        np.testing.assert_allclose(summarized[stat], expected[stat])
+
+def test_summary_of_all_runs(experimental):
+    summary = aggregate.CoefficientSummary(experimental.dataFrame)
+    a31 = experimental.dataFrame['a31']
+    summarized = summary.summarize()['a31']
+    assert summarized['count'].iloc[0] == a31.count()
+    np.testing.assert_allclose(summarized['std'].iloc[0], a31.std())
+
+@pytest.mark.parametrize('kwargs', subsets + [{'Duration': 30.}])
+def test_filters_match_subset(experimental, kwargs, tmp_path):
+    pytest.importorskip('pyarrow')
+    directory = str(tmp_path / 'export')
+    export.write_runs(experimental, directory, bode=False)
+
+    runs = export.read_runs(directory, columns=['RunID'],
+            filters=export.subset_filters(**kwargs))
+
+    # the exported nan speeds compare false, like the nan MeanFits
+    expected = experimental.subset(**kwargs)
+    if 'Speed' in kwargs:
+        expected = expected[expected['Speed'].notnull()]
+    assert sorted(runs['RunID']) == sorted(expected['RunID'])